@@ -0,0 +1,156 @@
+from typing import Optional
+import threading
+import asyncio
+import math
+
+CGROUP_V2_MEMORY_MAX = "/sys/fs/cgroup/memory.max"
+CGROUP_V1_MEMORY_LIMIT = "/sys/fs/cgroup/memory/memory.limit_in_bytes"
+
+# cgroup v1 reports "no limit" as a page-aligned value near 2^63
+CGROUP_V1_UNLIMITED = 1 << 60
+
+def cgroup_memory_limit() -> Optional[int]:
+    """
+    Memory limit of the container in bytes, from cgroup v2 or v1, or None if there is none.
+    """
+    for path in (CGROUP_V2_MEMORY_MAX, CGROUP_V1_MEMORY_LIMIT):
+        try:
+            with open(path) as file:
+                value = file.read().strip()
+        except OSError:
+            continue
+
+        if value == "max":
+            return None
+        try:
+            limit = int(value)
+        except ValueError:
+            continue
+
+        return limit if limit < CGROUP_V1_UNLIMITED else None
+
+    return None
+
+def browsers_for_memory(browser_mb: int, reserved_mb: int) -> Optional[int]:
+    """
+    How many browsers fit in the container's memory limit after `reserved_mb`
+    is set aside for the service itself. None if the container has no limit.
+    """
+    limit = cgroup_memory_limit()
+    if limit is None:
+        return None
+
+    available_mb = limit // (1024 * 1024) - reserved_mb
+    return max(1, available_mb // max(1, browser_mb))
+
+class AdmissionRejected(Exception):
+    """
+    Raised when a login is turned away because the queue is full.
+    """
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Too many logins queued, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+class AdmissionControl:
+    """
+    Bounds the browser logins waiting for a slot.
+
+    Every login that needs a browser must be admitted before it waits for one. At
+    most `slots` run at once (the rest wait on the auth semaphore and browser pool)
+    and at most `max_queue` wait; past that, callers are turned away with an
+    estimate of when to retry based on the measured average login time.
+    Thread safe.
+    """
+
+    def __init__(self, slots: int, max_queue: int, initial_estimate: float = 30, smoothing: float = 0.2):
+        """
+        Args:
+            slots (int): Logins that run at once
+            max_queue (int): Admitted logins that may wait for a slot
+            initial_estimate (float): Seconds per login assumed until one has been measured
+            smoothing (float): Weight of each new login time in the moving average
+        """
+        self.slots = max(1, slots)
+        self.max_queue = max(0, max_queue)
+        self.smoothing = smoothing
+
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._average = initial_estimate
+
+        self.admitted = 0
+        self.shed = 0
+        self.measured = 0
+
+    @property
+    def capacity(self) -> int:
+        return self.slots + self.max_queue
+
+    def try_enter(self) -> bool:
+        """
+        Admit one login if there is room in the running slots or the queue.
+        An admitted caller must call leave() once the login ends.
+        """
+        if self._enter():
+            return True
+
+        with self._lock:
+            self.shed += 1
+        return False
+
+    async def enter(self, poll: float = 0.5):
+        """
+        Wait until a login can be admitted, for callers that hold their own backlog
+        (batches) and so must not be turned away. Must be followed by leave().
+        """
+        while not self._enter():
+            await asyncio.sleep(poll)
+
+    def _enter(self) -> bool:
+        with self._lock:
+            if self._pending >= self.capacity:
+                return False
+
+            self._pending += 1
+            self.admitted += 1
+            return True
+
+    def leave(self):
+        with self._lock:
+            self._pending = max(0, self._pending - 1)
+
+    def observe(self, seconds: float):
+        """
+        Record how long one browser login took, from taking its slot to finishing.
+        """
+        with self._lock:
+            if self.measured == 0:
+                self._average = seconds
+            else:
+                self._average += self.smoothing * (seconds - self._average)
+            self.measured += 1
+
+    def retry_after(self) -> int:
+        """
+        Seconds until a login submitted now could take a slot: one average
+        login for each round of `slots` logins ahead of it.
+        """
+        with self._lock:
+            ahead = max(0, self._pending - self.slots + 1)
+            rounds = math.ceil(ahead / self.slots)
+            return max(1, math.ceil(rounds * self._average))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "pending": self._pending,
+                "running": min(self._pending, self.slots),
+                "queued": max(0, self._pending - self.slots),
+                "slots": self.slots,
+                "max_queue": self.max_queue,
+                "admitted": self.admitted,
+                "shed": self.shed,
+                "average_login": round(self._average, 2),
+                "measured": self.measured,
+            }
@@ -0,0 +1,88 @@
+from dataclasses import dataclass, field
+from typing import List, Optional
+import asyncio
+import random
+import httpx
+import time
+
+@dataclass
+class Sample:
+    latency: float
+    status: int
+    stale: bool = False
+
+@dataclass
+class LevelResult:
+    concurrency: int
+    elapsed: float
+    samples: List[Sample] = field(default_factory=list)
+
+async def drive(
+    url: str,
+    concurrency: int,
+    requests: int,
+    type: str = "privacy",
+    repeat: float = 0.0,
+    password: str = "bench",
+    timeout: float = 300,
+    seed: Optional[int] = None,
+) -> LevelResult:
+    """
+    Send `requests` POST /authtask calls with at most `concurrency` in flight.
+
+    Args:
+        url (str): Base URL of the service
+        concurrency (int): Requests in flight at once
+        requests (int): Total requests
+        type (str): Merchant type sent with every request
+        repeat (float): Share of requests reusing an account already requested in this run,
+                        which the service should answer from its token cache
+        password (str): Password sent with every request
+        timeout (float): Per-request timeout in seconds
+        seed (int): Seed for choosing repeated accounts
+
+    Returns:
+        LevelResult: One sample per request and the wall time of the whole level
+    """
+    rng = random.Random(seed)
+    run = f"{int(time.time())}-{concurrency}"
+
+    emails = []
+    for index in range(requests):
+        if emails and rng.random() < repeat:
+            emails.append(rng.choice(emails))
+        else:
+            emails.append(f"bench-{run}-{index}@example.test")
+
+    queue = asyncio.Queue()
+    for email in emails:
+        queue.put_nowait(email)
+
+    result = LevelResult(concurrency=concurrency, elapsed=0.0)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, timeout=timeout, limits=limits) as client:
+
+        async def worker():
+            while True:
+                try:
+                    email = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+
+                started = time.monotonic()
+                try:
+                    response = await client.post("/authtask", json={"email": email, "password": password, "type": type})
+                    status = response.status_code
+                    stale = bool(response.json().get("stale")) if status == 200 else False
+                except (httpx.HTTPError, ValueError) as e:
+                    print(f"Request for {email} failed: {e}")
+                    status, stale = 0, False
+
+                result.samples.append(Sample(time.monotonic() - started, status, stale))
+
+        started = time.monotonic()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        result.elapsed = time.monotonic() - started
+
+    return result
@@ -0,0 +1,117 @@
+from typing import Dict, List
+import threading
+import os
+
+BROWSER_NAMES = ("camoufox", "firefox")
+
+def _processes() -> Dict[int, tuple]:
+    """
+    Returns:
+        dict: pid -> (parent pid, command name, resident memory in bytes) for every process in /proc
+    """
+    processes = {}
+
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+
+        try:
+            with open(f"/proc/{entry}/status") as file:
+                fields = dict(line.split(":", 1) for line in file if ":" in line)
+        except (OSError, ValueError):
+            continue
+
+        rss = fields.get("VmRSS", "0 kB").split()[0]
+        processes[int(entry)] = (int(fields.get("PPid", "0")), fields.get("Name", "").strip().lower(), int(rss) * 1024)
+
+    return processes
+
+def browser_memory(root: int = None) -> List[int]:
+    """
+    Resident memory of every browser started below a process, one entry per browser.
+
+    A browser is a camoufox/firefox process whose parent is not one; its content
+    and utility processes are counted towards it. Linux only (reads /proc).
+
+    Args:
+        root (int): Process whose descendants are searched, by default this one
+
+    Returns:
+        list: Bytes per browser instance
+    """
+    root = root or os.getpid()
+    processes = _processes()
+
+    children = {}
+    for pid, (ppid, _, _) in processes.items():
+        children.setdefault(ppid, []).append(pid)
+
+    def is_browser(pid):
+        return pid in processes and any(name in processes[pid][1] for name in BROWSER_NAMES)
+
+    def subtree_rss(pid):
+        total = processes[pid][2]
+        for child in children.get(pid, []):
+            total += subtree_rss(child)
+        return total
+
+    instances = []
+    stack = list(children.get(root, []))
+    while stack:
+        pid = stack.pop()
+        if is_browser(pid) and not is_browser(processes[pid][0]):
+            instances.append(subtree_rss(pid))
+        else:
+            stack.extend(children.get(pid, []))
+
+    return instances
+
+class MemorySampler:
+    """
+    Samples browser_memory() on a background thread and keeps the peaks.
+    """
+
+    def __init__(self, interval: float = 1.0):
+        self.interval = interval
+        self.peak_total = 0
+        self.peak_instance = 0
+        self.peak_instances = 0
+        self.samples = []
+
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self) -> "MemorySampler":
+        self._thread = threading.Thread(target=self._run, name="memory-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            try:
+                instances = browser_memory()
+            except OSError:
+                instances = []
+
+            if instances:
+                self.samples.append(sum(instances) / len(instances))
+                self.peak_total = max(self.peak_total, sum(instances))
+                self.peak_instance = max(self.peak_instance, max(instances))
+                self.peak_instances = max(self.peak_instances, len(instances))
+
+            if self._stop.wait(self.interval):
+                return
+
+    def stats(self) -> dict:
+        mean = sum(self.samples) / len(self.samples) if self.samples else 0
+
+        return {
+            "browsers": self.peak_instances,
+            "mean_per_browser_mb": round(mean / 2**20, 1),
+            "peak_per_browser_mb": round(self.peak_instance / 2**20, 1),
+            "peak_total_mb": round(self.peak_total / 2**20, 1),
+        }
@@ -0,0 +1,275 @@
+from datetime import datetime, timezone
+from collections import namedtuple
+from typing import Callable, Optional
+from enum import Enum
+import threading
+import operator
+import queue
+import copy
+import time
+
+class ChangeType(Enum):
+    ADDED = 1
+    MODIFIED = 2
+    REMOVED = 3
+
+DocumentChange = namedtuple("DocumentChange", ["type", "document"])
+
+OPERATORS = {
+    "<": operator.lt,
+    "<=": operator.le,
+    "==": operator.eq,
+    "!=": operator.ne,
+    ">=": operator.ge,
+    ">": operator.gt,
+}
+
+class MemorySnapshot:
+    def __init__(self, reference: "MemoryDocument", data: Optional[dict]):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+
+    @property
+    def exists(self) -> bool:
+        return self._data is not None
+
+    def to_dict(self) -> Optional[dict]:
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+class MemoryDocument:
+    def __init__(self, client: "MemoryFirestore", collection: str, id: str):
+        self._client = client
+        self.collection = collection
+        self.id = id
+
+    def __eq__(self, other):
+        return isinstance(other, MemoryDocument) and (self.collection, self.id) == (other.collection, other.id)
+
+    def __hash__(self):
+        return hash((self.collection, self.id))
+
+    @property
+    def path(self) -> str:
+        return f"{self.collection}/{self.id}"
+
+    def get(self, transaction=None) -> MemorySnapshot:
+        self._client._round_trip("reads")
+        return self._client._snapshot(self)
+
+    def set(self, data: dict, merge: bool = False):
+        self._client._round_trip("writes")
+        self._client._write(self, data, merge)
+
+    def update(self, data: dict):
+        self.set(data, merge=True)
+
+    def delete(self):
+        self._client._round_trip("deletes")
+        self._client._delete(self)
+
+class MemoryQuery:
+    def __init__(self, client: "MemoryFirestore", collection: str, filters=(), limit: Optional[int] = None):
+        self._client = client
+        self.collection = collection
+        self._filters = tuple(filters)
+        self._limit = limit
+
+    def where(self, filter) -> "MemoryQuery":
+        # Accepts google.cloud.firestore FieldFilter objects
+        return MemoryQuery(self._client, self.collection, self._filters + ((filter.field_path, filter.op_string, filter.value),), self._limit)
+
+    def limit(self, count: int) -> "MemoryQuery":
+        return MemoryQuery(self._client, self.collection, self._filters, count)
+
+    def _matches(self, data: dict) -> bool:
+        for field, op, value in self._filters:
+            if field not in data:
+                return False
+            try:
+                if not OPERATORS[op](data[field], value):
+                    return False
+            except TypeError:
+                return False
+        return True
+
+    def stream(self):
+        self._client._round_trip("reads")
+        with self._client._lock:
+            documents = self._client._collections.get(self.collection, {})
+            matches = [
+                MemorySnapshot(MemoryDocument(self._client, self.collection, id), copy.deepcopy(data))
+                for id, data in documents.items()
+                if self._matches(data)
+            ]
+
+        return iter(matches[:self._limit] if self._limit is not None else matches)
+
+class MemoryCollection(MemoryQuery):
+    def document(self, id: str) -> MemoryDocument:
+        return MemoryDocument(self._client, self.collection, id)
+
+    def on_snapshot(self, callback: Callable) -> "MemoryWatch":
+        return self._client._watch(self.collection, callback)
+
+class MemoryBatch:
+    def __init__(self, client: "MemoryFirestore"):
+        self._client = client
+        self._writes = []
+
+    def set(self, reference: MemoryDocument, data: dict, merge: bool = False):
+        self._writes.append((reference, data, merge))
+
+    def delete(self, reference: MemoryDocument):
+        self._writes.append((reference, None, False))
+
+    def commit(self):
+        self._client._round_trip("writes")
+        for reference, data, merge in self._writes:
+            if data is None:
+                self._client._delete(reference)
+            else:
+                self._client._write(reference, data, merge)
+        self._writes = []
+
+class MemoryWatch:
+    def __init__(self, client: "MemoryFirestore", collection: str, callback: Callable):
+        self._client = client
+        self.collection = collection
+        self.callback = callback
+
+    def unsubscribe(self):
+        self._client._unwatch(self)
+
+class MemoryFirestore:
+    """
+    In-process stand-in for the synchronous google.cloud.firestore Client, for benchmarks.
+
+    Supports what this service uses: document get/set/update/delete, get_all,
+    batched writes, where()/limit()/stream() queries and on_snapshot listeners,
+    whose callbacks run on a separate thread as they do with the real client.
+    Transactions (and so AUTH_LEASES) are not supported.
+
+    Every round trip blocks the calling thread for `latency` seconds so the
+    cost of Firestore calls shows up where the real client would put it.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        """
+        Args:
+            latency (float): Seconds each read, write, delete or commit blocks the caller
+        """
+        self.latency = latency
+
+        self._lock = threading.Lock()
+        self._collections = {}
+        self._watches = []
+        self._events = queue.Queue()
+        self._dispatcher = None
+
+        self.reads = 0
+        self.writes = 0
+        self.deletes = 0
+
+    def collection(self, name: str) -> MemoryCollection:
+        return MemoryCollection(self, name)
+
+    def get_all(self, references):
+        references = list(references)
+        self._round_trip("reads")
+        return iter([self._snapshot(reference) for reference in references])
+
+    def batch(self) -> MemoryBatch:
+        return MemoryBatch(self)
+
+    def transaction(self):
+        raise NotImplementedError("MemoryFirestore does not support transactions")
+
+    def close(self):
+        with self._lock:
+            self._watches = []
+
+    def _round_trip(self, kind: str):
+        with self._lock:
+            setattr(self, kind, getattr(self, kind) + 1)
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+    def _snapshot(self, reference: MemoryDocument) -> MemorySnapshot:
+        with self._lock:
+            data = self._collections.get(reference.collection, {}).get(reference.id)
+            return MemorySnapshot(reference, copy.deepcopy(data))
+
+    def _write(self, reference: MemoryDocument, data: dict, merge: bool):
+        with self._lock:
+            documents = self._collections.setdefault(reference.collection, {})
+            existing = documents.get(reference.id)
+
+            if merge and existing is not None:
+                stored = {**existing, **copy.deepcopy(data)}
+            else:
+                stored = copy.deepcopy(data)
+            documents[reference.id] = stored
+
+            change = ChangeType.ADDED if existing is None else ChangeType.MODIFIED
+            self._notify(reference, stored, change)
+
+    def _delete(self, reference: MemoryDocument):
+        with self._lock:
+            existing = self._collections.get(reference.collection, {}).pop(reference.id, None)
+            if existing is not None:
+                self._notify(reference, None, ChangeType.REMOVED)
+
+    def _notify(self, reference: MemoryDocument, data: Optional[dict], change: ChangeType):
+        # Called with the lock held
+        for watch in self._watches:
+            if watch.collection == reference.collection:
+                snapshot = MemorySnapshot(reference, copy.deepcopy(data) if data is not None else {})
+                self._events.put((watch, [snapshot], [DocumentChange(change, snapshot)]))
+
+    def _watch(self, collection: str, callback: Callable) -> MemoryWatch:
+        watch = MemoryWatch(self, collection, callback)
+
+        with self._lock:
+            self._watches.append(watch)
+
+            # Like Firestore, the first snapshot reports every existing document as added
+            snapshots = [
+                MemorySnapshot(MemoryDocument(self, collection, id), copy.deepcopy(data))
+                for id, data in self._collections.get(collection, {}).items()
+            ]
+            self._events.put((watch, snapshots, [DocumentChange(ChangeType.ADDED, s) for s in snapshots]))
+
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(target=self._dispatch, name="memory-firestore-watch", daemon=True)
+                self._dispatcher.start()
+
+        return watch
+
+    def _unwatch(self, watch: MemoryWatch):
+        with self._lock:
+            if watch in self._watches:
+                self._watches.remove(watch)
+
+    def _dispatch(self):
+        while True:
+            watch, docs, changes = self._events.get()
+
+            with self._lock:
+                active = watch in self._watches
+            if not active:
+                continue
+
+            try:
+                watch.callback(docs, changes, datetime.now(timezone.utc))
+            except Exception as e:
+                print(f"Error in snapshot callback: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "reads": self.reads,
+                "writes": self.writes,
+                "deletes": self.deletes,
+                "documents": {name: len(documents) for name, documents in self._collections.items()},
+            }
@@ -0,0 +1,341 @@
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from dataclasses import replace
+from functools import partial
+from typing import Callable, Optional
+from token_capture import privacy_token_from_response, cognito_token_from_response
+from flows import PRIVACY, EXTEND, ProviderSpec, poll_auth_token_privacy
+import threading
+import base64
+import random
+import json
+import time
+import uuid
+
+PRIVACY_LOGIN = """<!doctype html>
+<html><head><title>Privacy</title></head><body>
+<form id="login">
+  <input name="email" type="email">
+  <input name="password" type="password">
+  <button type="submit">Log In</button>
+</form>
+<div id="otp"></div>
+<script>
+var email = null;
+
+function alert_(text) {
+  var alert = document.createElement("div");
+  alert.setAttribute("role", "alert");
+  alert.textContent = text;
+  document.body.appendChild(alert);
+}
+
+document.getElementById("login").addEventListener("submit", function(event) {
+  event.preventDefault();
+  email = this.email.value;
+  fetch("/api/login", {method: "POST", body: JSON.stringify({email: email, password: this.password.value})})
+    .then(function(response) { return response.json().then(function(data) { return [response.ok, data]; }); })
+    .then(function(result) {
+      if (!result[0]) { alert_(result[1].error); return; }
+      document.getElementById("otp").innerHTML = '<input name="code0" maxlength="6"><button type="button" id="continue">Continue</button>';
+      document.getElementById("continue").addEventListener("click", submitCode);
+    });
+});
+
+function submitCode() {
+  var code = document.querySelector('[name="code0"]').value;
+  fetch("/api/otp", {method: "POST", body: JSON.stringify({email: email, code: code})})
+    .then(function(response) { return response.json().then(function(data) { return [response.ok, data]; }); })
+    .then(function(result) {
+      if (!result[0]) { alert_(result[1].error); return; }
+      window.location = "/";
+    });
+}
+</script>
+</body></html>
+"""
+
+EXTEND_SIGNIN = """<!doctype html>
+<html><head><title>Extend</title></head><body>
+<form id="signin">
+  <input id="email" type="email">
+  <input id="loginPwd" type="password">
+  <button id="loginBtn" type="submit">Sign In</button>
+</form>
+<div id="content"><div><div><div><div></div><div></div><div></div><div><div id="verify"></div></div></div></div></div></div>
+<script>
+var email = null;
+
+function post(path, body) {
+  return fetch(path, {method: "POST", body: JSON.stringify(body)})
+    .then(function(response) { return response.json().then(function(data) { return [response.ok, data]; }); });
+}
+
+document.getElementById("signin").addEventListener("submit", function(event) {
+  event.preventDefault();
+  email = document.getElementById("email").value;
+  post("/api/login", {email: email, password: document.getElementById("loginPwd").value}).then(function(result) {
+    if (!result[0]) {
+      var error = document.createElement("span");
+      error.setAttribute("data-testid", "signInError");
+      error.textContent = result[1].error;
+      document.getElementById("signin").appendChild(error);
+      return;
+    }
+    document.getElementById("verify").innerHTML =
+      '<form><div><input autocomplete="one-time-code" maxlength="6"></div><button id="verifyCodeBtn" type="button">Verify</button></form>';
+    document.getElementById("verifyCodeBtn").addEventListener("click", submitCode);
+  });
+});
+
+function submitCode() {
+  var field = document.querySelector("#verify input");
+  post("/cognito", {email: email, code: field.value}).then(function(result) {
+    if (!result[0]) {
+      var error = document.createElement("div");
+      error.innerHTML = "<span></span>";
+      error.firstChild.textContent = result[1].error;
+      field.parentNode.appendChild(error);
+      return;
+    }
+    var auth = result[1].AuthenticationResult;
+    var prefix = "CognitoIdentityServiceProvider.bench." + email + ".";
+    localStorage[prefix + "accessToken"] = auth.AccessToken;
+    localStorage[prefix + "refreshToken"] = auth.RefreshToken;
+    window.location = "/";
+  });
+}
+</script>
+</body></html>
+"""
+
+HOME = """<!doctype html>
+<html><head><title>Home</title></head><body><h1>Dashboard</h1></body></html>
+"""
+
+def mock_jwt(email: str, issuer: str, ttl: float) -> str:
+    """
+    An unsigned JWT with the claims the service reads (exp, iss, sub).
+    """
+    def encode(data: dict) -> str:
+        return base64.urlsafe_b64encode(json.dumps(data).encode()).rstrip(b"=").decode()
+
+    claims = {
+        "sub": email,
+        "iss": issuer,
+        "exp": int(time.time() + ttl),
+        "jti": uuid.uuid4().hex
+    }
+    return f"{encode({'alg': 'none', 'typ': 'JWT'})}.{encode(claims)}.bench"
+
+class OtpInjector:
+    """
+    Plays the part of the mail pipeline: hands each code a mock site sends to the
+    token store after `delay` seconds, as the real pipeline does with emailed codes.
+    """
+
+    def __init__(self, put_otp: Callable[[str, str], None], delay: float = 1.0):
+        """
+        Args:
+            put_otp: Stores a code for an email, e.g. TokenStore.put_otp
+            delay (float): Seconds between a code being sent and it being stored
+        """
+        self.put_otp = put_otp
+        self.delay = delay
+
+        self.sent = 0
+
+    def send(self, email: str, code: str):
+        timer = threading.Timer(self.delay, self._deliver, args=(email, code))
+        timer.daemon = True
+        timer.start()
+
+    def _deliver(self, email: str, code: str):
+        try:
+            self.put_otp(email, code)
+            self.sent += 1
+        except Exception as e:
+            print(f"Error delivering OTP for {email}: {e}")
+
+class MockSite:
+    """
+    Local signin site for one provider with the same selectors, request sequence and
+    token delivery as the real one: password step, an emailed OTP, then a token
+    in a Set-Cookie header (Privacy) or a Cognito-style JSON response (Extend).
+
+    Every response is held back by `delay` seconds. A `login_error_rate` share of
+    password steps and an `otp_error_rate` share of OTP steps are rejected with
+    the provider's error element.
+    """
+
+    def __init__(
+        self,
+        provider: str,
+        send_otp: Callable[[str, str], None],
+        delay: float = 0.0,
+        login_error_rate: float = 0.0,
+        otp_error_rate: float = 0.0,
+        token_ttl: float = 600,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        """
+        Args:
+            provider (str): "privacy" or "extend"
+            send_otp: Called with (email, code) when a password step succeeds
+            delay (float): Seconds added to every response
+            login_error_rate (float): Share of password steps rejected
+            otp_error_rate (float): Share of OTP steps rejected
+            token_ttl (float): Lifetime of issued tokens in seconds (their exp claim)
+            host (str): Interface to listen on
+            port (int): Port to listen on, 0 for any free port
+        """
+        if provider not in ("privacy", "extend"):
+            raise ValueError(f"Unknown provider: {provider}")
+
+        self.provider = provider
+        self.send_otp = send_otp
+        self.delay = delay
+        self.login_error_rate = login_error_rate
+        self.otp_error_rate = otp_error_rate
+        self.token_ttl = token_ttl
+
+        self._lock = threading.Lock()
+        self._codes = {}
+
+        self.logins = 0
+        self.login_errors = 0
+        self.otp_errors = 0
+        self.tokens = 0
+
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockSite":
+        self._thread = threading.Thread(target=self.server.serve_forever, name=f"mock-{self.provider}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def spec(self) -> ProviderSpec:
+        """
+        The provider's real spec pointed at this site. Selectors are left untouched.
+        """
+        host = self.server.server_address[0]
+
+        if self.provider == "privacy":
+            return replace(
+                PRIVACY,
+                login_url=f"{self.url}/login",
+                home_url=f"{self.url}/",
+                capture_token=partial(privacy_token_from_response, host_suffix=host),
+                poll_token=partial(poll_auth_token_privacy, domain=host)
+            )
+
+        return replace(
+            EXTEND,
+            login_url=f"{self.url}/signin",
+            home_url=f"{self.url}/",
+            capture_token=partial(cognito_token_from_response, host_prefix=host)
+        )
+
+    def _login(self, body: dict):
+        email = body.get("email") or ""
+
+        with self._lock:
+            self.logins += 1
+            if random.random() < self.login_error_rate:
+                self.login_errors += 1
+                return 401, {"error": "Incorrect email or password."}, None
+
+            code = f"{random.randint(0, 999999):06d}"
+            self._codes[email] = code
+
+        self.send_otp(email, code)
+        return 200, {"otp": True}, None
+
+    def _verify(self, body: dict):
+        email = body.get("email") or ""
+
+        with self._lock:
+            expected = self._codes.get(email)
+            if expected is None or body.get("code") != expected or random.random() < self.otp_error_rate:
+                self.otp_errors += 1
+                return 400, {"error": "Invalid verification code."}, None
+
+            del self._codes[email]
+            self.tokens += 1
+
+        token = mock_jwt(email, self.url, self.token_ttl)
+
+        if self.provider == "privacy":
+            return 200, {"ok": True}, f"token={token}; Path=/; SameSite=Lax"
+
+        return 200, {"AuthenticationResult": {"AccessToken": token, "RefreshToken": uuid.uuid4().hex}}, None
+
+    def _handler(self):
+        site = self
+
+        pages = {
+            "privacy": {"/login": PRIVACY_LOGIN, "/": HOME},
+            "extend": {"/signin": EXTEND_SIGNIN, "/": HOME},
+        }[self.provider]
+
+        routes = {"/api/login": site._login}
+        routes["/api/otp" if self.provider == "privacy" else "/cognito"] = site._verify
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status: int, body: bytes, content_type: str, cookie: Optional[str] = None):
+                if site.delay > 0:
+                    time.sleep(site.delay)
+
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                if cookie:
+                    self.send_header("Set-Cookie", cookie)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                page = pages.get(self.path.split("?")[0])
+                if page is None:
+                    self._send(404, b"Not found", "text/plain")
+                else:
+                    self._send(200, page.encode(), "text/html; charset=utf-8")
+
+            def do_POST(self):
+                route = routes.get(self.path)
+                if route is None:
+                    self._send(404, b"Not found", "text/plain")
+                    return
+
+                length = int(self.headers.get("Content-Length") or 0)
+                try:
+                    body = json.loads(self.rfile.read(length) or b"{}")
+                except ValueError:
+                    body = {}
+
+                status, data, cookie = route(body if isinstance(body, dict) else {})
+                self._send(status, json.dumps(data).encode(), "application/json", cookie)
+
+        return Handler
+
+    def stats(self) -> dict:
+        return {
+            "logins": self.logins,
+            "login_errors": self.login_errors,
+            "otp_errors": self.otp_errors,
+            "tokens": self.tokens,
+        }
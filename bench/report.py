@@ -0,0 +1,59 @@
+from collections import Counter
+from typing import List
+from bench.load import LevelResult
+
+def percentile(values: List[float], p: float) -> float:
+    """
+    Nearest-rank percentile of a list of numbers, 0.0 if it is empty.
+    """
+    if not values:
+        return 0.0
+
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+def summarize(result: LevelResult, memory: dict) -> dict:
+    """
+    Throughput, latency percentiles and status counts of one concurrency level.
+
+    Args:
+        result (LevelResult): Samples from bench.load.drive()
+        memory (dict): MemorySampler.stats() for the level
+    """
+    latencies = [s.latency for s in result.samples]
+    ok = sum(1 for s in result.samples if s.status == 200)
+
+    return {
+        "concurrency": result.concurrency,
+        "requests": len(result.samples),
+        "ok": ok,
+        "statuses": dict(Counter(str(s.status) for s in result.samples)),
+        "elapsed": round(result.elapsed, 2),
+        "throughput": round(len(result.samples) / result.elapsed, 3) if result.elapsed else 0.0,
+        "ok_throughput": round(ok / result.elapsed, 3) if result.elapsed else 0.0,
+        "p50": round(percentile(latencies, 0.5), 3),
+        "p95": round(percentile(latencies, 0.95), 3),
+        "p99": round(percentile(latencies, 0.99), 3),
+        "max": round(max(latencies), 3) if latencies else 0.0,
+        "memory": memory,
+    }
+
+def format_table(rows: List[dict]) -> str:
+    columns = [
+        ("conc", lambda r: r["concurrency"]),
+        ("reqs", lambda r: r["requests"]),
+        ("ok", lambda r: r["ok"]),
+        ("req/s", lambda r: r["throughput"]),
+        ("p50 s", lambda r: r["p50"]),
+        ("p95 s", lambda r: r["p95"]),
+        ("p99 s", lambda r: r["p99"]),
+        ("browsers", lambda r: r["memory"]["browsers"]),
+        ("MB/browser", lambda r: r["memory"]["mean_per_browser_mb"]),
+        ("peak MB", lambda r: r["memory"]["peak_total_mb"]),
+        ("statuses", lambda r: " ".join(f"{k}:{v}" for k, v in sorted(r["statuses"].items()))),
+    ]
+
+    cells = [[name for name, _ in columns]] + [[str(value(row)) for _, value in columns] for row in rows]
+    widths = [max(len(line[i]) for line in cells) for i in range(len(columns))]
+
+    return "\n".join("  ".join(cell.rjust(width) for cell, width in zip(line, widths)) for line in cells)
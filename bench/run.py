@@ -0,0 +1,161 @@
+"""
+Offline end-to-end benchmark of the auth service.
+
+Runs main.py's Flask app in-process against local mock signin sites and an
+in-memory Firestore (or one of the local token stores), drives POST /authtask at each concurrency level and prints
+throughput, latency percentiles and per-browser memory.
+
+    python -m bench.run --levels 1,4,8 --requests 40 --type privacy
+
+Service settings come from the same environment variables as main.py
+(BROWSER_POOL_SIZE, AUTH_CONCURRENCY, AUTH_QUEUE_DEPTH, LEAN_PAGES, ...), so a change can be
+measured by running the benchmark once with it and once without.
+"""
+from werkzeug.serving import make_server
+from bench.memory_firestore import MemoryFirestore
+from bench.mock_sites import MockSite, OtpInjector
+from bench.memory import MemorySampler
+from bench.load import drive
+from bench.report import summarize, format_table
+import threading
+import tempfile
+import argparse
+import asyncio
+import json
+import time
+import os
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Offline benchmark of /authtask")
+    parser.add_argument("--type", choices=("privacy", "extend"), default="privacy", help="Merchant type to log in to")
+    parser.add_argument("--levels", default="1,4,8", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=20, help="Requests per level")
+    parser.add_argument("--repeat", type=float, default=0.0, help="Share of requests for an account already requested (cache hits)")
+    parser.add_argument("--store", choices=("firestore", "memory", "sqlite", "shm"), default="firestore",
+                        help="TOKEN_STORE for the service; firestore uses the in-memory stand-in")
+    parser.add_argument("--pool-size", type=int, help="BROWSER_POOL_SIZE for the service")
+    parser.add_argument("--auth-concurrency", type=int, help="AUTH_CONCURRENCY for the service")
+    parser.add_argument("--site-delay", type=float, default=0.1, help="Seconds the mock site holds back every response")
+    parser.add_argument("--login-error-rate", type=float, default=0.0, help="Share of password steps the mock site rejects")
+    parser.add_argument("--otp-error-rate", type=float, default=0.0, help="Share of OTP steps the mock site rejects")
+    parser.add_argument("--otp-delay", type=float, default=1.0, help="Seconds between a code being sent and it reaching the token store")
+    parser.add_argument("--firestore-latency", type=float, default=0.02, help="Seconds every round trip to the Firestore stand-in blocks")
+    parser.add_argument("--token-ttl", type=float, default=600, help="Lifetime of mock tokens in seconds")
+    parser.add_argument("--warmup", type=float, default=120, help="Maximum seconds to wait for the browser pool to fill")
+    parser.add_argument("--json", help="Also write the report to this file")
+    return parser.parse_args()
+
+def configure_environment(args):
+    """
+    Set main.py's settings before it is imported. Background jobs that would
+    skew the measurement or need the network are off unless set explicitly.
+    """
+    if args.pool_size:
+        os.environ["BROWSER_POOL_SIZE"] = str(args.pool_size)
+    if args.auth_concurrency:
+        os.environ["AUTH_CONCURRENCY"] = str(args.auth_concurrency)
+
+    os.environ["TOKEN_STORE"] = args.store
+    if args.store == "sqlite":
+        os.environ.setdefault("TOKEN_STORE_PATH", os.path.join(tempfile.mkdtemp(prefix="bench-"), "tokens.db"))
+
+    os.environ.setdefault("SWEEPER_ENABLED", "0")
+    os.environ.setdefault("REFRESH_ENABLED", "0")
+    os.environ.setdefault("HTTP_REFRESH_ENABLED", "0")
+
+def wait_for_pool(pool, timeout: float):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if pool.stats()["idle"] >= pool.size:
+            return True
+        time.sleep(0.5)
+
+    print(f"Browser pool not full after {timeout:.0f}s, starting anyway: {pool.stats()}")
+    return False
+
+def main():
+    args = parse_args()
+    configure_environment(args)
+
+    import main as service
+
+    db = MemoryFirestore(latency=args.firestore_latency)
+
+    # get_db() returns the client once it exists, so the stand-in is used everywhere
+    service._db = db
+
+    otp = OtpInjector(service.token_store.put_otp, delay=args.otp_delay)
+    site = MockSite(
+        args.type,
+        otp.send,
+        delay=args.site_delay,
+        login_error_rate=args.login_error_rate,
+        otp_error_rate=args.otp_error_rate,
+        token_ttl=args.token_ttl
+    ).start()
+
+    service.PROVIDERS[args.type] = site.spec()
+
+    def launch_options(proxy=None):
+        # No proxy or GeoIP lookup: the sites are local and the run must not need the network
+        options = service.browser_launch_options(proxy)
+        return {**options, "proxy": None, "geoip": False, "headless": True}
+
+    service.browser_pool.launch_options = launch_options
+
+    server = make_server("127.0.0.1", 0, service.app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="bench-server", daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}"
+
+    print(f"Service at {url}, {args.type} mock site at {site.url}")
+
+    service.get_loop()
+    wait_for_pool(service.browser_pool, args.warmup)
+
+    rows = []
+    try:
+        for level in [int(level) for level in args.levels.split(",") if level.strip()]:
+            with MemorySampler() as sampler:
+                result = asyncio.run(drive(url, level, args.requests, type=args.type, repeat=args.repeat))
+
+            row = summarize(result, sampler.stats())
+            rows.append(row)
+            print(f"concurrency {level}: {row['throughput']} req/s, p50 {row['p50']}s, p95 {row['p95']}s, p99 {row['p99']}s")
+    finally:
+        print()
+        print(format_table(rows))
+
+        report = {
+            "settings": {
+                **vars(args),
+                "BROWSER_POOL_SIZE": service.BROWSER_POOL_SIZE,
+                "AUTH_CONCURRENCY": service.AUTH_CONCURRENCY,
+                "AUTH_QUEUE_DEPTH": service.AUTH_QUEUE_DEPTH,
+                "LEAN_PAGES": service.LEAN_PAGES,
+            },
+            "levels": rows,
+            "site": site.stats(),
+            "firestore": db.stats(),
+            "otp": {"sent": otp.sent},
+            "service": {
+                "browser_pool": service.browser_pool.stats(),
+                "token_cache": service.token_cache.stats(),
+                "token_store": service.token_store.stats(),
+                "admission": service.admission.stats(),
+            },
+        }
+
+        if args.json:
+            with open(args.json, "w") as file:
+                json.dump(report, file, indent=2, default=str)
+            print(f"Report written to {args.json}")
+
+        server.shutdown()
+        site.stop()
+        try:
+            asyncio.run_coroutine_threadsafe(service.browser_pool.close(), service.get_loop()).result(timeout=60)
+        except Exception as e:
+            print(f"Error closing browser pool: {e}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+from contextlib import asynccontextmanager
+from camoufox import AsyncCamoufox
+from collections import deque
+from typing import Callable, Optional
+import asyncio
+import time
+
+def same_proxy(a: Optional[dict], b: Optional[dict]) -> bool:
+    if not a or not b:
+        return False
+    return a.get("server") == b.get("server") and a.get("username") == b.get("username")
+
+class PooledBrowser:
+    """
+    A pre-launched Camoufox browser owned by the pool.
+
+    Each browser is launched with its own proxy, so every context handed out
+    from it shares that proxy and the GeoIP fingerprint computed at launch.
+    """
+
+    def __init__(self, manager, browser, launch_options: dict):
+        self.manager = manager
+        self.browser = browser
+        self.launch_options = launch_options
+        self.uses = 0
+        self.launched_at = time.monotonic()
+        self.crashed = False
+
+        browser.on("disconnected", self._on_disconnected)
+
+    def _on_disconnected(self, *_):
+        self.crashed = True
+
+    @property
+    def proxy(self) -> Optional[dict]:
+        return self.launch_options.get("proxy")
+
+    def is_healthy(self) -> bool:
+        try:
+            return not self.crashed and self.browser.is_connected()
+        except Exception:
+            return False
+
+class BrowserPool:
+    """
+    Long-lived pool of pre-launched Camoufox browsers.
+
+    Every checkout gets exclusive use of one browser and a fresh, isolated
+    context on it. Browsers are recycled after `max_uses` checkouts, when they
+    crash or disconnect, or when the task using them raises.
+
+    The pool must only be used from the event loop it was started on.
+    """
+
+    def __init__(
+        self,
+        launch_options: Callable[..., dict],
+        size: int = 2,
+        max_uses: int = 20,
+        health_interval: float = 30,
+        launch_timeout: float = 60,
+        on_launch_error: Optional[Callable[[dict, Exception], None]] = None,
+    ):
+        """
+        Args:
+            launch_options: Callable returning AsyncCamoufox keyword arguments for a new browser
+            size (int): Number of browsers kept warm
+            max_uses (int): Checkouts before a browser is relaunched
+            health_interval (float): Seconds between health checks of idle browsers
+            launch_timeout (float): Maximum seconds to wait for a browser to launch
+            on_launch_error: Optional callback (launch options, error) when a launch fails
+        """
+        self.launch_options = launch_options
+        self.size = max(1, size)
+        self.max_uses = max(1, max_uses)
+        self.health_interval = health_interval
+        self.launch_timeout = launch_timeout
+        self.on_launch_error = on_launch_error
+
+        self._idle = deque()
+        self._idle_changed: Optional[asyncio.Condition] = None
+        self._browsers = set()
+        self._owners = {}
+        self._pending = 0
+        self._health_task = None
+        self._closed = False
+
+        self.wait_times = deque(maxlen=500)
+        self.checkouts = 0
+        self.launches = 0
+        self.launch_failures = 0
+        self.recycled = 0
+        self.affinity_hits = 0
+        self.affinity_misses = 0
+
+    async def start(self):
+        """
+        Launch the pool's browsers and start the health checker. Safe to call more than once.
+        """
+        if self._idle_changed is not None:
+            return
+
+        self._idle_changed = asyncio.Condition()
+        self._closed = False
+
+        for _ in range(self.size):
+            self._spawn()
+
+        self._health_task = asyncio.create_task(self._health_loop())
+
+    def _spawn(self):
+        """
+        Launch a replacement browser in the background and add it to the idle queue.
+        """
+        self._pending += 1
+        asyncio.create_task(self._launch_into_pool())
+
+    async def _launch_into_pool(self):
+        try:
+            while not self._closed:
+                options = self.launch_options()
+                try:
+                    pooled = await asyncio.wait_for(self._launch(options), timeout=self.launch_timeout)
+                except Exception as e:
+                    self.launch_failures += 1
+                    print(f"Error launching pooled browser: {e}")
+                    if self.on_launch_error:
+                        self.on_launch_error(options, e)
+                    await asyncio.sleep(2)
+                    continue
+
+                if self._closed:
+                    await self._shutdown(pooled)
+                    return
+
+                self._browsers.add(pooled)
+                await self._put_idle(pooled)
+                return
+        finally:
+            self._pending -= 1
+
+    async def _launch(self, options: dict) -> PooledBrowser:
+        manager = AsyncCamoufox(**options)
+        browser = await manager.__aenter__()
+        self.launches += 1
+        return PooledBrowser(manager, browser, options)
+
+    async def _shutdown(self, pooled: PooledBrowser):
+        self._browsers.discard(pooled)
+        try:
+            await pooled.manager.__aexit__(None, None, None)
+        except Exception as e:
+            print(f"Error closing pooled browser: {e}")
+
+    async def _retire(self, pooled: PooledBrowser):
+        """
+        Close a browser and launch a replacement so the pool stays at full size.
+        The old browser is gone before the new one starts, so the pool never exceeds its size.
+        """
+        self.recycled += 1
+        await self._shutdown(pooled)
+
+        if not self._closed:
+            self._spawn()
+
+    async def _put_idle(self, pooled: PooledBrowser):
+        async with self._idle_changed:
+            self._idle.append(pooled)
+            self._idle_changed.notify()
+
+    async def _get_idle(self, proxy: Optional[dict] = None) -> PooledBrowser:
+        """
+        Take an idle browser, preferring one launched on `proxy`.
+        """
+        async with self._idle_changed:
+            await self._idle_changed.wait_for(lambda: len(self._idle) > 0)
+
+            if proxy is not None:
+                for pooled in self._idle:
+                    if same_proxy(pooled.proxy, proxy):
+                        self._idle.remove(pooled)
+                        self.affinity_hits += 1
+                        return pooled
+
+            return self._idle.popleft()
+
+    async def _acquire(self, proxy: Optional[dict] = None) -> PooledBrowser:
+        await self.start()
+
+        while True:
+            pooled = await self._get_idle(proxy)
+            if not pooled.is_healthy():
+                print("Discarding unhealthy pooled browser")
+                await self._retire(pooled)
+                continue
+
+            return pooled
+
+    async def _release(self, pooled: PooledBrowser, recycle: bool = False):
+        pooled.uses += 1
+
+        if recycle or self._closed or pooled.uses >= self.max_uses or not pooled.is_healthy():
+            await self._retire(pooled)
+        else:
+            await self._put_idle(pooled)
+
+    @asynccontextmanager
+    async def context(self, proxy: Optional[dict] = None, **context_options):
+        """
+        Check out a browser and yield a fresh context on it.
+
+        The context is closed and the browser returned to the pool on exit. If the
+        block raises, the browser is recycled so a retry gets a new one.
+
+        Args:
+            proxy (dict): Preferred proxy settings. An idle browser on it is used if there is one,
+                          otherwise any idle browser; proxy_of() tells the caller which it got
+            **context_options: Extra keyword arguments for browser.new_context()
+
+        Yields:
+            BrowserContext: Isolated Playwright context
+        """
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        pooled = await self._acquire(proxy)
+        if proxy is not None and not same_proxy(pooled.proxy, proxy):
+            self.affinity_misses += 1
+
+        wait = loop.time() - start
+        self.wait_times.append(wait)
+        self.checkouts += 1
+        if wait >= 1:
+            print(f"Waited {wait:.2f}s for a pooled browser")
+
+        recycle = False
+        context = None
+        try:
+            context = await pooled.browser.new_context(**context_options)
+            self._owners[context] = pooled
+            yield context
+        except BaseException:
+            recycle = True
+            raise
+        finally:
+            if context is not None:
+                self._owners.pop(context, None)
+                try:
+                    await context.close()
+                except Exception:
+                    recycle = True
+            await self._release(pooled, recycle=recycle)
+
+    def proxy_of(self, context) -> Optional[dict]:
+        """
+        Proxy settings of the browser a checked-out context belongs to.
+        """
+        pooled = self._owners.get(context)
+        return pooled.proxy if pooled else None
+
+    async def _health_loop(self):
+        while not self._closed:
+            await asyncio.sleep(self.health_interval)
+            try:
+                await self._check_idle()
+            except Exception as e:
+                print(f"Error checking browser pool health: {e}")
+
+    async def _check_idle(self):
+        """
+        Probe every idle browser by opening and closing a context, replacing any that fail.
+        """
+        for _ in range(len(self._idle)):
+            async with self._idle_changed:
+                if not self._idle:
+                    return
+                pooled = self._idle.popleft()
+
+            healthy = pooled.is_healthy()
+            if healthy:
+                try:
+                    probe = await asyncio.wait_for(pooled.browser.new_context(), timeout=10)
+                    await probe.close()
+                except Exception:
+                    healthy = False
+
+            if healthy:
+                await self._put_idle(pooled)
+            else:
+                print("Health check failed, relaunching pooled browser")
+                await self._retire(pooled)
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: Pool size, utilisation and checkout wait times in seconds
+        """
+        waits = sorted(self.wait_times)
+
+        def percentile(p):
+            if not waits:
+                return 0.0
+            return round(waits[min(len(waits) - 1, int(len(waits) * p))], 4)
+
+        return {
+            "size": self.size,
+            "browsers": len(self._browsers),
+            "idle": len(self._idle),
+            "launching": self._pending,
+            "checkouts": self.checkouts,
+            "launches": self.launches,
+            "launch_failures": self.launch_failures,
+            "recycled": self.recycled,
+            "affinity_hits": self.affinity_hits,
+            "affinity_misses": self.affinity_misses,
+            "wait_p50": percentile(0.5),
+            "wait_p95": percentile(0.95),
+            "wait_max": round(waits[-1], 4) if waits else 0.0,
+        }
+
+    async def close(self):
+        self._closed = True
+
+        if self._health_task:
+            self._health_task.cancel()
+            self._health_task = None
+
+        for pooled in list(self._browsers):
+            await self._shutdown(pooled)
+
+        self._idle.clear()
+        self._idle_changed = None
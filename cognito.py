@@ -0,0 +1,161 @@
+from urllib.parse import urlparse
+from typing import Optional
+from sessions import password_digest, password_matches
+from tokens import decode_claims
+from storage_io import run_io
+import httpx
+import json
+import os
+
+INITIATE_AUTH = "AWSCognitoIdentityProviderService.InitiateAuth"
+
+class CognitoRefresher:
+    """
+    Renews Cognito access tokens over HTTPS with a stored refresh token, without a browser.
+
+    The region and app client ID are read from the access token's iss and
+    client_id claims, so only the refresh token has to be captured at login.
+    Credentials are kept in memory and, when a store is given, in the encrypted
+    session store so they survive restarts. They are tied to the password of the
+    login that produced them and only used when a caller presents the same one.
+    """
+
+    def __init__(self, store=None, secret: Optional[bytes] = None, timeout: float = 10, max_connections: int = 20):
+        """
+        Args:
+            store: Optional SessionStore used to persist refresh credentials
+            secret (bytes): Key for the password HMAC of in-memory credentials; random if not given
+            timeout (float): HTTP timeout in seconds
+            max_connections (int): Size of the shared connection pool
+        """
+        self.store = store
+        self.secret = secret or os.urandom(32)
+        self.timeout = timeout
+        self.max_connections = max_connections
+
+        self._credentials = {}
+        self._client: Optional[httpx.AsyncClient] = None
+
+        self.refreshed = 0
+        self.failed = 0
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # Created lazily so it belongs to the loop that uses it
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections)
+            )
+        return self._client
+
+    async def remember(self, email: str, password: str, access_token: str, refresh_token: str):
+        """
+        Store the refresh credentials captured at the end of a browser login with `password`.
+        """
+        claims = decode_claims(access_token) or {}
+        issuer = urlparse(claims.get("iss", "")).hostname or ""
+        client_id = claims.get("client_id")
+
+        if not issuer.startswith("cognito-idp.") or not client_id:
+            print(f"Access token for {email} is not a Cognito token, not storing refresh token")
+            return
+
+        credentials = {
+            "refresh_token": refresh_token,
+            "client_id": client_id,
+            "endpoint": f"https://{issuer}/"
+        }
+        self._credentials[email] = (credentials, password_digest(self.secret, password))
+
+        if self.store:
+            await run_io(self.store.save, "cognito", email, credentials, password)
+
+    async def forget(self, email: str):
+        self._credentials.pop(email, None)
+
+        if self.store:
+            await run_io(self.store.delete, "cognito", email)
+
+    async def _load(self, email: str, password: str) -> Optional[dict]:
+        entry = self._credentials.get(email)
+
+        if entry is not None:
+            credentials, digest = entry
+            return credentials if password_matches(self.secret, digest, password) else None
+
+        if not self.store:
+            return None
+
+        # The session store only returns credentials saved with this password
+        credentials = await run_io(self.store.load, "cognito", email, password)
+        if credentials:
+            self._credentials[email] = (credentials, password_digest(self.secret, password))
+
+        return credentials
+
+    async def refresh(self, email: str, password: str) -> Optional[str]:
+        """
+        Returns:
+            str: A new access token, or None if there are no credentials for this password
+                 or Cognito refused them
+        """
+        credentials = await self._load(email, password)
+        if not credentials:
+            return None
+
+        body = {
+            "AuthFlow": "REFRESH_TOKEN_AUTH",
+            "ClientId": credentials["client_id"],
+            "AuthParameters": {
+                "REFRESH_TOKEN": credentials["refresh_token"]
+            }
+        }
+
+        try:
+            response = await self._get_client().post(
+                credentials["endpoint"],
+                content=json.dumps(body),
+                headers={
+                    "Content-Type": "application/x-amz-json-1.1",
+                    "X-Amz-Target": INITIATE_AUTH
+                }
+            )
+        except httpx.HTTPError as e:
+            print(f"Error refreshing Cognito token for {email}: {e}")
+            self.failed += 1
+            return None
+
+        if response.status_code != 200:
+            print(f"Cognito refresh failed for {email}: {response.status_code} {response.text[:200]}")
+            self.failed += 1
+
+            # A revoked or expired refresh token will never work again
+            if response.status_code == 400 and "NotAuthorizedException" in response.text:
+                await self.forget(email)
+            return None
+
+        result = response.json().get("AuthenticationResult") or {}
+        access_token = result.get("AccessToken")
+
+        if not access_token:
+            self.failed += 1
+            return None
+
+        # Present when refresh token rotation is enabled on the app client
+        if result.get("RefreshToken"):
+            await self.remember(email, password, access_token, result["RefreshToken"])
+
+        self.refreshed += 1
+        return access_token
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self) -> dict:
+        return {
+            "accounts": len(self._credentials),
+            "refreshed": self.refreshed,
+            "failed": self.failed,
+        }
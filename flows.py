@@ -0,0 +1,608 @@
+from token_capture import TokenCapture, privacy_token_from_response, cognito_token_from_response
+from datetime import datetime, timezone, timedelta
+from typing import Awaitable, Callable, Optional
+from dataclasses import dataclass
+from urllib.parse import urlparse
+from metrics import checkpoint
+from tokens import token_expiry
+from storage_io import run_io
+import traceback
+import asyncio
+import random
+import json
+import time
+
+# Third-party hosts the login pages load that the login itself never needs. Feature flag
+# (LaunchDarkly) and error reporting (Sentry) SDKs are left alone: the pages wait on them
+ANALYTICS_HOSTS = (
+    "google-analytics.com",
+    "googletagmanager.com",
+    "doubleclick.net",
+    "segment.io",
+    "segment.com",
+    "hotjar.com",
+    "fullstory.com",
+    "intercom.io",
+    "intercomcdn.com",
+    "mixpanel.com",
+    "amplitude.com",
+    "heapanalytics.com",
+    "facebook.net",
+    "facebook.com",
+    "clarity.ms",
+    "datadoghq.com",
+    "browser-intake-datadoghq.com",
+)
+
+@dataclass(frozen=True)
+class ProviderSpec:
+    """
+    Everything that differs between providers' login flows.
+    Selectors are Playwright locators (CSS or XPath).
+    """
+    name: str
+    login_url: str
+    home_url: str
+    email_field: str
+    password_field: str
+    login_button: str
+    login_error: str
+    otp_field: str
+    otp_button: str
+    otp_error: str
+    capture_token: Callable[[object], Awaitable[Optional[str]]]
+    poll_token: Callable[[object], Awaitable[Optional[str]]]
+    read_refresh_token: Optional[Callable[[object], Awaitable[Optional[str]]]] = None
+    click_pause: float = 0.0
+    # Navigation is considered done at this point; the flow then waits for the form explicitly
+    wait_until: str = "domcontentloaded"
+    blocked_resource_types: tuple = ("image", "media", "font")
+    blocked_hosts: tuple = ANALYTICS_HOSTS
+
+async def poll_auth_token_privacy(page, max_attempts: int = 15, domain: str = "app.privacy.com") -> Optional[str]:
+    """
+    Extract JWT authentication token from browser cookies on app.privacy.com.
+    Polls cookies every 2 seconds, by default for up to 30 seconds.
+    
+    Args:
+        page: Camoufox/Playwright page instance
+        max_attempts (int): Number of polls
+        domain (str): Cookie domain the token is set on
+    Returns:
+        str: JWT token if found, None otherwise
+    """
+    try:
+        attempt = 0
+
+        while attempt < max_attempts:
+            try:
+                # Get cookies from the current page context
+                cookies = await page.context.cookies()
+                
+                # Look for the "token" cookie on app.privacy.com
+                for cookie in cookies:
+                    if cookie.get("name") == "token" and domain in cookie.get("domain", ""):
+                        jwt_token = cookie.get("value", "")
+                        if jwt_token:
+                            print(f"Found JWT token: {jwt_token[:20]}...")
+                            return jwt_token
+                
+                # Wait 2 seconds before next attempt
+                await asyncio.sleep(2.0)
+                attempt += 1
+            
+            except Exception as eval_error:
+                print(f"Error checking cookies: {eval_error}")
+                await asyncio.sleep(2.0)
+                attempt += 1
+                continue
+
+        print("No JWT token found in cookies after polling")
+        return None
+
+    except Exception as e:
+        print(f"Error extracting auth token: {e}")
+        return None
+
+async def poll_auth_token_extend(page, max_attempts: int = 15) -> Optional[str]:
+    """
+    Extract authentication token from the page using the same method as Swift code.
+    Polls localStorage every 2 seconds looking for Cognito access token.
+    Args:
+        page: Camoufox page instance
+        max_attempts (int): Number of polls (default 15, 30 seconds)
+    Returns:
+        str: Authentication token if found, None otherwise
+    """
+    try:
+        js_script = """
+        (function() {
+            function lookup(suffix) {
+                var key = Object.keys(localStorage).find(function(key) {
+                    return key.startsWith("CognitoIdentityServiceProvider") && key.endsWith(suffix);
+                });
+                if (!key) return null;
+                return localStorage[key];
+            }
+            var accessToken = lookup("accessToken");
+            return JSON.stringify({
+                accessToken: accessToken
+            });
+        })()
+        """
+        
+        # Poll for access token every 2 seconds
+        attempt = 0
+        
+        while attempt < max_attempts:
+            try:
+                # Execute the JavaScript to look for the access token
+                result = await page.evaluate(js_script)
+                
+                if result:
+                    try:
+                        # Handle case where result might already be parsed
+                        if isinstance(result, dict):
+                            access_token = result.get("accessToken", "")
+                        else:
+                            token_data = json.loads(result)
+                            access_token = token_data.get("accessToken", "")
+                        
+                        if access_token:
+                            print(f"Found access token: {access_token[:20]}...")
+                            return access_token
+                    except (json.JSONDecodeError, TypeError) as parse_error:
+                        print(f"Error parsing result: {parse_error}")
+                        pass
+                
+                # Wait 2 seconds before next attempt (using async sleep)
+                await asyncio.sleep(2.0)
+                attempt += 1
+                
+            except Exception as eval_error:
+                print(f"Error evaluating JavaScript: {eval_error}")
+                await asyncio.sleep(2.0)
+                attempt += 1
+                continue
+        
+        print("No Cognito access token found after polling")
+        return None
+        
+    except Exception as e:
+        print(f"Error extracting auth token: {e}")
+        return None
+
+async def first_signal(signals: dict, timeout: float) -> Optional[str]:
+    """
+    Wait for the first of several page signals to succeed.
+    
+    Args:
+        signals (dict): Name -> awaitable that completes when the signal is seen
+        timeout (float): Maximum seconds to wait
+    
+    Returns:
+        str: Name of the first signal that completed without an error, None if none did in time
+    """
+    tasks = {asyncio.ensure_future(awaitable): name for name, awaitable in signals.items()}
+    pending = set(tasks)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+
+    try:
+        while pending:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return None
+
+            done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+
+            for task in done:
+                if not task.cancelled() and task.exception() is None:
+                    return tasks[task]
+
+        return None
+    finally:
+        for task in pending:
+            task.cancel()
+
+def is_retryable_error(error) -> bool:
+    """
+    Determine if an error is retryable.
+    
+    Args:
+        error: Exception object
+    
+    Returns:
+        bool: True if error is retryable, False otherwise
+    """
+    error_str = str(error).lower()
+    retryable_errors = [
+        'timeout',
+        'network',
+        'connection',
+        'proxy',
+        'dns',
+        'ssl',
+        'tls',
+        'browser disconnected',
+        'page crashed',
+        'navigation timeout',
+        'target closed'  # Added for Playwright/Camoufox specific errors
+    ]
+    
+    return any(retryable_error in error_str for retryable_error in retryable_errors)
+
+async def read_cognito_refresh_token(page) -> Optional[str]:
+    """
+    Read the Cognito refresh token the signed-in page keeps in localStorage.
+    """
+    try:
+        return await page.evaluate("""
+        (function() {
+            var key = Object.keys(localStorage).find(function(key) {
+                return key.startsWith("CognitoIdentityServiceProvider") && key.endsWith("refreshToken");
+            });
+            return key ? localStorage[key] : null;
+        })()
+        """)
+    except Exception as e:
+        print(f"Error reading refresh token: {e}")
+        return None
+
+async def block_resources(context, spec: ProviderSpec):
+    """
+    Abort requests for the spec's blocked resource types and hosts on every page of a context.
+    """
+    blocked_types = set(spec.blocked_resource_types)
+    blocked_hosts = spec.blocked_hosts
+
+    async def route(route):
+        request = route.request
+        host = urlparse(request.url).hostname or ""
+
+        if request.resource_type in blocked_types or any(host == h or host.endswith("." + h) for h in blocked_hosts):
+            await route.abort()
+        else:
+            await route.continue_()
+
+    await context.route("**/*", route)
+
+def stored_values(state: dict) -> set:
+    """
+    Every cookie and localStorage value in a Playwright storage_state, i.e. any token it restores.
+    """
+    values = {cookie.get("value") for cookie in state.get("cookies", [])}
+    for origin in state.get("origins", []):
+        values.update(item.get("value") for item in origin.get("localStorage", []))
+    values.discard(None)
+    values.discard("")
+    return values
+
+def is_fresh(token: str, margin: timedelta = timedelta(minutes=1)) -> bool:
+    """
+    Whether a token is not about to expire. Tokens without an exp claim count as fresh.
+    """
+    expiry = token_expiry(token)
+    return expiry is None or expiry > datetime.now(timezone.utc) + margin
+
+PRIVACY = ProviderSpec(
+    name="privacy",
+    login_url="https://app.privacy.com/login",
+    home_url="https://app.privacy.com/",
+    email_field='[name="email"]',
+    password_field='[name="password"]',
+    login_button='button[type="submit"]',
+    login_error='div[role="alert"]',
+    otp_field='[name="code0"]',
+    otp_button='button:has-text("Continue")',
+    otp_error='div[role="alert"]',
+    capture_token=privacy_token_from_response,
+    poll_token=poll_auth_token_privacy,
+    click_pause=0.2
+)
+
+EXTEND = ProviderSpec(
+    name="extend",
+    login_url="https://app.paywithextend.com/signin",
+    home_url="https://app.paywithextend.com/",
+    email_field='#email',
+    password_field='#loginPwd',
+    login_button='#loginBtn',
+    login_error='//span[@data-testid="signInError"]',
+    otp_field='//*[@id="content"]/div/div[1]/div/div[4]/div[1]/form/div[1]/input',
+    otp_button='#verifyCodeBtn',
+    otp_error='//*[@id="content"]/div/div[1]/div/div[4]/div[1]/form/div[1]/div/span',
+    capture_token=cognito_token_from_response,
+    poll_token=poll_auth_token_extend,
+    read_refresh_token=read_cognito_refresh_token
+)
+
+PROVIDERS = {
+    "privacy": PRIVACY,
+    "extend": EXTEND
+}
+
+class LoginFlow:
+    """
+    Browser login shared by every provider: password step, OTP step and token
+    extraction, driven by a ProviderSpec. Handles retries and phase timing.
+    """
+
+    def __init__(self, pool, wait_for_otp: Callable[[str, object], Awaitable[Optional[str]]], report: Optional[Callable] = None, max_retries: int = 1, sessions=None, session_poll_attempts: int = 5, on_refresh_token: Optional[Callable] = None, lean: bool = True, proxies=None, affinity=None):
+        """
+        Args:
+            pool: BrowserPool handing out browser contexts
+            wait_for_otp: Coroutine function (email, store) -> OTP code or None
+            report: Optional progress callback taking a message
+            max_retries (int): Extra attempts after a retryable error
+            sessions: Optional SessionStore; saved sessions are tried before the password and OTP flow
+            session_poll_attempts (int): Token polls (2 seconds apart) when resuming a session
+            on_refresh_token: Optional coroutine function (provider, email, password, access token, refresh token)
+                              called when a signed-in page exposes a refresh token
+            lean (bool): Block the spec's images, media, fonts and analytics hosts and navigate
+                         with spec.wait_until; False loads pages fully as a normal visit would
+            proxies: Optional ProxyPool told how each browser's proxy performed
+            affinity: Optional ProxyAffinity; logins reuse the proxy that last worked for the account
+        """
+        self.pool = pool
+        self.wait_for_otp = wait_for_otp
+        self.report = report or (lambda message: None)
+        self.max_retries = max_retries
+        self.sessions = sessions
+        self.session_poll_attempts = session_poll_attempts
+        self.on_refresh_token = on_refresh_token
+        self.lean = lean
+        self.proxies = proxies
+        self.affinity = affinity
+
+    async def run(self, spec: ProviderSpec, store, email, password) -> Optional[str]:
+        """
+        Authenticate with a provider using Camoufox browser automation.
+        Includes OTP handling and retry logic for retryable errors.
+        
+        Args:
+            spec (ProviderSpec): Provider to log in to
+            store: Token store handed to wait_for_otp
+            email (str): Login email
+            password (str): Login password
+        
+        Returns:
+            str: Authentication token if successful, a "Login Failed: ..." / "OTP Failed: ..."
+                 message if the provider rejected the login, None otherwise
+        """
+        proxy = None
+        if self.affinity:
+            proxy = await run_io(self.affinity.get, spec.name, email)
+
+        if self.sessions:
+            auth_token = await self._resume(spec, email, password, proxy)
+            if auth_token:
+                return auth_token
+
+        for retry_count in range(self.max_retries + 1):
+            try:
+                return await self._attempt(spec, store, email, password, proxy)
+            except Exception as e:
+                print(f"Browser automation error: {e}")
+
+                # Check if this is a retryable error
+                if is_retryable_error(e) and retry_count < self.max_retries:
+                    print(f"Retryable error detected, retrying... (attempt {retry_count + 1})")
+                    # The account's usual proxy may be what failed; let the pool choose
+                    proxy = None
+                    continue
+
+                return None
+
+    async def _open(self, context, spec: ProviderSpec, url: str, ignore=()):
+        """
+        Open a page with a token capture attached and navigate to url.
+        Tokens in `ignore` are not captured.
+        
+        Returns:
+            tuple: (page, TokenCapture)
+        """
+        if self.lean:
+            await block_resources(context, spec)
+
+        page = await context.new_page()
+        capture = TokenCapture(page, spec.capture_token, ignore=ignore)
+        checkpoint("browser")
+
+        started = time.monotonic()
+        await page.goto(url, wait_until=spec.wait_until if self.lean else "load")
+        checkpoint("goto")
+
+        if self.proxies:
+            self.proxies.report_success(self.pool.proxy_of(context), time.monotonic() - started)
+
+        return page, capture
+
+    async def _attempt(self, spec: ProviderSpec, store, email, password, proxy: Optional[dict] = None) -> Optional[str]:
+        async with self.pool.context(proxy=proxy) as context:
+            try:
+                # Open the signin page in a fresh context on a pooled browser
+                page, capture = await self._open(context, spec, spec.login_url)
+
+                await self._fill(page, spec.email_field, email, spec, timeout=20000, delay=random.uniform(5, 10))
+                await self._fill(page, spec.password_field, password, spec, timeout=10000, delay=random.uniform(5, 10))
+
+                await asyncio.sleep(0.25)
+
+                submit_url = await self._click(page, spec.login_button)
+                checkpoint("fill_login")
+
+                # Whichever comes first decides the next step: a login error, the OTP field or a navigation
+                login_error = page.locator(spec.login_error)
+                outcome = await first_signal({
+                    "error": login_error.wait_for(timeout=6000),
+                    "otp": page.locator(spec.otp_field).wait_for(timeout=6000),
+                    "navigated": page.wait_for_url(lambda url: url != submit_url, timeout=6000)
+                }, timeout=6)
+                checkpoint("login_outcome")
+
+                if outcome == "error":
+                    return f'Login Failed: {await self._error_text(login_error)}'
+
+                # Get OTP code
+                self.report("waiting for OTP")
+                otp = await self.wait_for_otp(email, store)
+                checkpoint("otp_wait")
+
+                if not otp or len(otp) != 6:
+                    # Check for login error element again
+                    try:
+                        if await login_error.is_visible():
+                            return f'Login Failed: {await self._error_text(login_error)}'
+                    except Exception:
+                        pass
+
+                    print("No otp found or bad format")
+                    return None
+
+                await self._fill(page, spec.otp_field, otp, spec, timeout=10000, delay=random.uniform(10, 20))
+
+                await asyncio.sleep(0.25)
+
+                submit_url = await self._click(page, spec.otp_button)
+                checkpoint("otp_submit")
+
+                # Whichever comes first decides the next step: an OTP error, the token or a navigation
+                otp_error = page.locator(spec.otp_error)
+                outcome = await first_signal({
+                    "error": otp_error.wait_for(timeout=3000),
+                    "token": asyncio.shield(capture.future),
+                    "navigated": page.wait_for_url(lambda url: url != submit_url, timeout=3000)
+                }, timeout=3)
+                checkpoint("otp_outcome")
+
+                if outcome == "error":
+                    return f'OTP Failed: {await self._error_text(otp_error)}'
+
+                self.report("OTP submitted, extracting token")
+                auth_token = await capture.race(spec.poll_token(page))
+                checkpoint("extract_token")
+
+                if auth_token:
+                    await self._signed_in(page, context, spec, email, password, auth_token)
+
+                return auth_token
+
+            except Exception as page_error:
+                print(f"Page interaction error: {repr(page_error)}")
+                traceback.print_exc()
+
+                # Hand retryable errors to run() so the pool recycles this browser first
+                if is_retryable_error(page_error):
+                    if self.proxies:
+                        self.proxies.report_failure(self.pool.proxy_of(context))
+                    raise
+
+                return None
+
+    async def _resume(self, spec: ProviderSpec, email, password, proxy: Optional[dict] = None) -> Optional[str]:
+        """
+        Try to get a token from the account's saved session without logging in.
+        Only a session saved by a login with the same password is used.
+        
+        Tokens restored with the session are ignored: they are what the token store already
+        had, so only a token the page mints after loading counts.
+        
+        Returns:
+            str: A new token that is not about to expire, None if the session did not produce one
+        """
+        state = await run_io(self.sessions.load, spec.name, email, password)
+        if not state:
+            return None
+
+        self.report("resuming saved session")
+        restored = stored_values(state)
+
+        try:
+            async with self.pool.context(proxy=proxy, storage_state=state) as context:
+                page, capture = await self._open(context, spec, spec.home_url, ignore=restored)
+                auth_token = await capture.race(self._poll_new_token(spec, page, restored))
+
+                # Landing back on the login page means the session is gone, whatever is still stored
+                signed_out = page.url.startswith(spec.login_url)
+
+                if auth_token and not signed_out and is_fresh(auth_token):
+                    await self._signed_in(page, context, spec, email, password, auth_token)
+                    print(f"Resumed saved session for {email}")
+                    return auth_token
+        except Exception as e:
+            # Keep the session; this may be a proxy or browser problem rather than a dead session
+            print(f"Error resuming session for {email}: {e}")
+            return None
+        finally:
+            checkpoint("session_resume")
+
+        # A session that just did not mint a token in time may still work next time
+        if signed_out:
+            await run_io(self.sessions.delete, spec.name, email)
+        return None
+
+    async def _poll_new_token(self, spec: ProviderSpec, page, restored: set) -> Optional[str]:
+        """
+        Poll for a token other than the restored ones, session_poll_attempts times 2 seconds apart.
+        Gives up as soon as the page is back on the login page, i.e. the session is dead.
+        """
+        for _ in range(self.session_poll_attempts):
+            if page.url.startswith(spec.login_url):
+                return None
+
+            auth_token = await spec.poll_token(page, max_attempts=1)
+            if auth_token and auth_token not in restored:
+                return auth_token
+            if auth_token:
+                # poll_token only sleeps when it finds nothing
+                await asyncio.sleep(2.0)
+        return None
+
+    async def _signed_in(self, page, context, spec: ProviderSpec, email, password, auth_token: str):
+        """
+        Keep what a signed-in page offers for next time: its session, its proxy and any refresh token.
+        """
+        # The proxy the login actually ran on, which is the preferred one only if an idle browser had it
+        if self.affinity:
+            await run_io(self.affinity.set, spec.name, email, self.pool.proxy_of(context))
+
+        if self.sessions:
+            try:
+                state = await context.storage_state()
+                await run_io(self.sessions.save, spec.name, email, state, password)
+            except Exception as e:
+                print(f"Error saving session for {email}: {e}")
+
+        if spec.read_refresh_token and self.on_refresh_token:
+            refresh_token = await spec.read_refresh_token(page)
+            if refresh_token:
+                await self.on_refresh_token(spec.name, email, password, auth_token, refresh_token)
+
+    async def _fill(self, page, selector: str, value: str, spec: ProviderSpec, timeout: int, delay: float):
+        field = page.locator(selector)
+        await field.wait_for(timeout=timeout)
+        await field.hover()
+        await field.click()
+        if spec.click_pause:
+            await asyncio.sleep(spec.click_pause)
+        await field.press_sequentially(value, delay=delay)
+
+    async def _click(self, page, selector: str) -> str:
+        """
+        Click a submit button.
+        
+        Returns:
+            str: Page URL just before the click, for detecting the navigation it causes
+        """
+        button = page.locator(selector)
+        await button.wait_for(timeout=10000)
+        await button.hover()
+        submit_url = page.url
+        await button.click()
+        return submit_url
+
+    async def _error_text(self, locator) -> str:
+        error_text = await locator.inner_text(timeout=3000)
+        print(error_text)
+        return error_text
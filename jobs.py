@@ -0,0 +1,200 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from contextvars import ContextVar
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional
+import threading
+import uuid
+
+FINISHED = ("succeeded", "failed")
+
+# Job of the auth running in the current task, if it was submitted through the job API
+current_job: ContextVar[Optional["Job"]] = ContextVar("current_job", default=None)
+
+# Single-flight key of the login running in the current task; its progress goes to every job following it
+current_flight: ContextVar[Optional[Hashable]] = ContextVar("current_flight", default=None)
+
+class Job:
+    """
+    One asynchronous auth task and its progress events.
+    """
+
+    def __init__(self, type: str, email: str):
+        self.id = uuid.uuid4().hex
+        self.type = type
+        self.email = email
+        self.status = "queued"
+        self.created = datetime.now(timezone.utc)
+        self.updated = self.created
+        self.events = []
+        self.result = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED
+
+    def to_dict(self, include_events: bool = False) -> dict:
+        data = {
+            "job_id": self.id,
+            "type": self.type,
+            "email": self.email,
+            "status": self.status,
+            "created": self.created.isoformat(),
+            "updated": self.updated.isoformat(),
+        }
+        if self.result is not None:
+            data["result"] = self.result
+        if include_events:
+            data["events"] = list(self.events)
+        return data
+
+class JobStore:
+    """
+    Bounded, thread-safe in-memory table of auth jobs.
+
+    When full, the oldest finished job is evicted (or the oldest job if none has
+    finished). An optional Firestore collection keeps a copy of each job so its
+    status survives eviction and can be read from other instances.
+    """
+
+    def __init__(self, max_size: int = 1000, get_db: Optional[Callable] = None, collection: str = "authjobs"):
+        self.max_size = max(1, max_size)
+        self.get_db = get_db
+        self.collection = collection
+
+        self._jobs = OrderedDict()
+        self._followers = {}
+        self._changed = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="jobs") if get_db else None
+
+    def create(self, type: str, email: str) -> Job:
+        job = Job(type, email)
+
+        with self._changed:
+            self._jobs[job.id] = job
+            self._evict()
+
+        self._persist(job)
+        return job
+
+    def _evict(self):
+        while len(self._jobs) > self.max_size:
+            victim = next((job_id for job_id, job in self._jobs.items() if job.finished), None)
+            if victim is None:
+                victim = next(iter(self._jobs))
+            del self._jobs[victim]
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._changed:
+            return self._jobs.get(job_id)
+
+    def load(self, job_id: str) -> Optional[dict]:
+        """
+        Job status as a dict, falling back to Firestore for jobs not held in memory.
+        """
+        job = self.get(job_id)
+        if job:
+            return job.to_dict()
+
+        if not self.get_db:
+            return None
+
+        try:
+            doc = self.get_db().collection(self.collection).document(job_id).get()
+            return doc.to_dict() if doc.exists else None
+        except Exception as e:
+            print(f"Error loading job {job_id}: {e}")
+            return None
+
+    def progress(self, job: Job, message: str, status: Optional[str] = None):
+        """
+        Record a progress event and wake up anything streaming the job.
+        """
+        with self._changed:
+            job.updated = datetime.now(timezone.utc)
+            if status:
+                job.status = status
+            job.events.append({
+                "time": job.updated.isoformat(),
+                "status": job.status,
+                "message": message,
+            })
+            self._changed.notify_all()
+
+        if status:
+            self._persist(job)
+
+    def follow(self, key: Hashable, job: Job):
+        """
+        Send progress of the shared login `key` to `job` until unfollow().
+        """
+        with self._changed:
+            self._followers.setdefault(key, []).append(job)
+
+    def unfollow(self, key: Hashable, job: Job):
+        with self._changed:
+            followers = self._followers.get(key, [])
+            if job in followers:
+                followers.remove(job)
+            if not followers:
+                self._followers.pop(key, None)
+
+    def report(self, message: str, status: Optional[str] = None):
+        """
+        Add a progress event to every job following the login of the current task, or else
+        to the job of the current task. Does nothing outside the job API.
+        """
+        key = current_flight.get()
+        if key is not None:
+            with self._changed:
+                targets = list(self._followers.get(key, ()))
+        else:
+            job = current_job.get()
+            targets = [job] if job is not None else []
+
+        for job in targets:
+            self.progress(job, message, status)
+
+    def finish(self, job: Job, body: dict, status_code: int):
+        job.result = {"status": status_code, "body": body}
+        self.progress(job, "finished", "succeeded" if status_code == 200 else "failed")
+
+    def wait(self, job: Job, seen: int, timeout: float) -> bool:
+        """
+        Block until the job has more than `seen` events or is finished.
+
+        Returns:
+            bool: True if something changed before the timeout
+        """
+        with self._changed:
+            return self._changed.wait_for(lambda: len(job.events) > seen or job.finished, timeout=timeout)
+
+    def _persist(self, job: Job):
+        if not self._executor:
+            return
+
+        data = job.to_dict()
+
+        def write():
+            try:
+                self.get_db().collection(self.collection).document(job.id).set(data)
+            except Exception as e:
+                print(f"Error saving job {job.id}: {e}")
+
+        self._executor.submit(write)
+
+    def stats(self) -> dict:
+        with self._changed:
+            jobs = list(self._jobs.values())
+            followed = len(self._followers)
+
+        counts = {}
+        for job in jobs:
+            counts[job.status] = counts.get(job.status, 0) + 1
+
+        return {
+            "size": len(jobs),
+            "followed_logins": followed,
+            "max_size": self.max_size,
+            "by_status": counts,
+        }
@@ -1,21 +1,134 @@
-from flask import Flask, request, jsonify, make_response
+from flask import Flask, Response, request, jsonify, make_response, stream_with_context
 from datetime import datetime, timezone, timedelta
 from google.oauth2 import service_account
-from camoufox import AsyncCamoufox
+from browser_pool import BrowserPool
+from token_cache import TokenCache
+from singleflight import SingleFlight
+from sweeper import Sweeper
+from refresher import RefreshScheduler
+from jobs import JobStore, current_flight, current_job
+from metrics import trace_login, checkpoint, count_request
+from flows import LoginFlow, PROVIDERS
+from sessions import SessionStore
+from cognito import CognitoRefresher
+from proxies import ProxyPool, ProxyAffinity
+from admission import AdmissionControl, AdmissionRejected, browsers_for_memory
+from stores import create_store
+from storage_io import run_io
+from tokens import token_expiry
+import storage_io
+import metrics
 from google.cloud import firestore
 from flask_cors import CORS
+from contextvars import ContextVar
 from typing import Optional
-import traceback
+import queue
+import threading
+import atexit
 import asyncio
-import random
 import json
+import hashlib
+import hmac
+import uuid
 import os
 
 TEST_TYPE = "Privacy" # Or "Extend"
 TEST_MODE = False
 
+# Tokens are fresh until their JWT exp claim minus TOKEN_EXP_MARGIN seconds.
+# The fixed lifetimes below (minutes) are only used for tokens without an exp claim.
 TOKEN_EXP_EXTEND = 9
 TOKEN_EXP_PRIVACY = 120
+TOKEN_EXP_MARGIN = int(os.environ.get("TOKEN_EXP_MARGIN", 60))
+
+# Memory one pooled browser needs and memory kept for the service itself. Under a cgroup
+# memory limit they cap the browsers in flight (and so the pool size) unless MAX_BROWSERS is set.
+BROWSER_MEMORY_MB = int(os.environ.get("BROWSER_MEMORY_MB", 400))
+SERVICE_MEMORY_MB = int(os.environ.get("SERVICE_MEMORY_MB", 400))
+MAX_BROWSERS = int(os.environ.get("MAX_BROWSERS", 0)) or browsers_for_memory(BROWSER_MEMORY_MB, SERVICE_MEMORY_MB)
+
+BROWSER_POOL_SIZE = int(os.environ.get("BROWSER_POOL_SIZE", 2))
+if MAX_BROWSERS:
+    BROWSER_POOL_SIZE = min(BROWSER_POOL_SIZE, MAX_BROWSERS)
+BROWSER_MAX_USES = int(os.environ.get("BROWSER_MAX_USES", 20))
+BROWSER_HEALTH_INTERVAL = 30
+
+OTP_EXP = 10
+
+SWEEPER_ENABLED = os.environ.get("SWEEPER_ENABLED", "1") == "1"
+SWEEP_INTERVAL = 300
+SWEEP_BATCH_SIZE = 200
+SWEEP_MAX_DELETES_PER_SEC = 100
+
+# Background refresh of opted-in accounts (request flag "refresh")
+REFRESH_ENABLED = os.environ.get("REFRESH_ENABLED", "1") == "1"
+REFRESH_AT = 0.8
+REFRESH_CONCURRENCY = 2
+REFRESH_IDLE = 30
+
+# Stale-while-revalidate: minutes past its expiry a token may still be served (never past
+# its own JWT exp claim), and whether that happens without the request flag "stale"
+STALE_GRACE = {
+    "extend": 3,
+    "privacy": 15
+}
+STALE_BY_DEFAULT = {
+    "extend": False,
+    "privacy": False
+}
+
+JOBS_MAX = 1000
+JOBS_FIRESTORE = os.environ.get("JOBS_FIRESTORE", "0") == "1"
+JOB_STREAM_KEEPALIVE = 15
+
+BATCH_MAX = 500
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", 4))
+BATCH_TYPE_CONCURRENCY = {
+    "extend": 2,
+    "privacy": 2
+}
+
+# Saved browser sessions, encrypted with SESSION_KEY (a Fernet key); disabled without a key
+SESSION_KEY = os.environ.get("SESSION_KEY")
+SESSION_STORE = os.environ.get("SESSION_STORE", "local")  # "local" or "firestore"
+SESSION_DIR = "sessions"
+
+# Renew Extend tokens over HTTPS with the Cognito refresh token before falling back to the browser
+HTTP_REFRESH_ENABLED = os.environ.get("HTTP_REFRESH_ENABLED", "1") == "1"
+
+# Skip images, media, fonts and analytics on signin pages and stop navigation at DOMContentLoaded
+LEAN_PAGES = os.environ.get("LEAN_PAGES", "1") == "1"
+
+# Keep each account on the proxy that last worked for it
+PROXY_AFFINITY_TTL = 24 * 60
+PROXY_AFFINITY_FIRESTORE = os.environ.get("PROXY_AFFINITY_FIRESTORE", "0") == "1"
+
+# Where tokens, OTP codes and auth leases live: "firestore", "memory", "sqlite" or "shm"
+# (SQLite on /dev/shm, shared by every worker on the host). TOKEN_STORE_PATH overrides the SQLite file.
+TOKEN_STORE = os.environ.get("TOKEN_STORE", "firestore")
+TOKEN_STORE_PATH = os.environ.get("TOKEN_STORE_PATH")
+
+# Shared secret the mail pipeline sends in the X-OTP-Secret header to POST /otp.
+# The endpoint only exists for the local stores and only when this is set.
+OTP_SECRET = os.environ.get("OTP_SECRET")
+
+# Threads for blocking storage calls made from the auth loop
+STORAGE_THREADS = int(os.environ.get("STORAGE_THREADS", 16))
+
+TOKEN_CACHE_SIZE = int(os.environ.get("TOKEN_CACHE_SIZE", 2048))
+
+AUTH_CONCURRENCY = int(os.environ.get("AUTH_CONCURRENCY", 8))
+AUTH_TIMEOUT = 180
+
+# Cache-miss logins that may wait for a browser; past that requests get a 429 with Retry-After
+AUTH_QUEUE_DEPTH = int(os.environ.get("AUTH_QUEUE_DEPTH", 16))
+
+# Cross-instance dedup via lease records in the token store ("authleases" in Firestore)
+AUTH_LEASES = os.environ.get("AUTH_LEASES", "0") == "1"
+AUTH_LEASE_TTL = AUTH_TIMEOUT + 30
+AUTH_LEASE_POLL = 2
+
+INSTANCE_ID = uuid.uuid4().hex
 
 app = Flask(__name__)
 
@@ -25,615 +138,775 @@ CORS(app, origins=[
     "http://127.0.0.1:3000"
 ])
 
-def parse_proxy(proxy_string):
-    try:
-        host, port, username, password = proxy_string.split(':')
-        return host, port, username, password
-    except:
-        return "", "", "", ""
+def browser_launch_options(proxy=None):
+    """
+    AsyncCamoufox launch arguments for a new pooled browser. Each browser gets its own proxy,
+    either the one requested or the next one from the proxy pool.
+    """
+    proxy_settings = proxy or get_proxy_settings()
+    if not proxy_settings:
+        print("No proxy available")
 
-def random_proxy():
-    proxies = []
-    
-    if not os.path.exists("proxies.txt"):
-        print(f'Error: proxies.txt not found.')
+    return {
+        "proxy": proxy_settings,
+        "geoip": True,
+        "config": {
+            "humanize": False
+        },
+        "headless": True if TEST_MODE else "virtual",
+        "firefox_user_prefs": {
+            "media.peerconnection.enabled": False
+        }
+    }
+
+proxy_pool = ProxyPool("proxies.txt")
+
+browser_pool = BrowserPool(
+    browser_launch_options,
+    size=BROWSER_POOL_SIZE,
+    max_uses=BROWSER_MAX_USES,
+    health_interval=BROWSER_HEALTH_INTERVAL,
+    on_launch_error=lambda options, error: report_launch_error(options, error)
+)
+
+# Created without a loop and bound to the shared loop on first use
+auth_semaphore = asyncio.Semaphore(AUTH_CONCURRENCY)
+auth_in_flight = 0
+auth_flights = SingleFlight()
+
+# Each running login holds a pooled browser, so no more than the pool size run at once
+admission = AdmissionControl(min(AUTH_CONCURRENCY, BROWSER_POOL_SIZE), AUTH_QUEUE_DEPTH)
+
+# Set by callers that hold their own backlog (batches): their logins wait for admission instead of being shed
+admission_waits: ContextVar[bool] = ContextVar("admission_waits", default=False)
+
+_loop = None
+_loop_lock = threading.Lock()
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """
+    Return the long-lived event loop that runs every auth, starting it on first use.
+    Pooled browsers are bound to the loop that launched them, so all auths must run here.
+    """
+    global _loop
+
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="auth-loop", daemon=True).start()
+            asyncio.run_coroutine_threadsafe(browser_pool.start(), _loop)
+            if REFRESH_ENABLED:
+                asyncio.run_coroutine_threadsafe(refresher.start(), _loop)
+
+    return _loop
+
+token_cache = TokenCache(max_size=TOKEN_CACHE_SIZE)
+
+def provider_for(type: str) -> str:
+    """
+    Normalised provider name for a merchant type; anything but Extend is handled as Privacy.
+    """
+    return "extend" if type.lower() == "extend" else "privacy"
+
+def token_ttl(type: str) -> timedelta:
+    """
+    How long a token of the given merchant type is treated as fresh when it has no exp claim.
+    """
+    TOKEN_EXP = TOKEN_EXP_EXTEND if type.lower() == "extend" else TOKEN_EXP_PRIVACY
+    return timedelta(minutes=TOKEN_EXP)
+
+def as_utc(value: datetime) -> datetime:
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+def token_expires(type: str, token: str, minted_at: datetime) -> datetime:
+    """
+    When a token stops being served as fresh: its JWT exp claim minus TOKEN_EXP_MARGIN,
+    or the merchant type's fixed lifetime after minting if it has no exp claim.
+    The signature is not verified; the provider does that when the token is used.
+    """
+    expiry = token_expiry(token)
+    if expiry is None:
+        return as_utc(minted_at) + token_ttl(type)
+    return expiry - timedelta(seconds=TOKEN_EXP_MARGIN)
+
+def record_expires(type: str, record: dict) -> Optional[datetime]:
+    """
+    Expiry of a stored token record. Records saved before expiries were stored get one from the token.
+    """
+    expires = record.get("expires")
+    if expires:
+        return as_utc(expires)
+
+    token = record.get("token")
+    age = record.get("age")
+    if not (token and age):
         return None
-    with open("proxies.txt", "r") as file:
-        proxies = [line.strip() for line in file if line.strip()]
+    return token_expires(type, token, age)
 
-    if proxies:
-        return random.choice(proxies)
-    
-    return None
+def stale_grace(type: str) -> timedelta:
+    """
+    How long past its expiry a token of the given merchant type may still be served stale.
+    """
+    return timedelta(minutes=STALE_GRACE.get(type.lower(), 0))
+
+def stale_until(type: str, token: str, expires: datetime) -> datetime:
+    """
+    Last moment a token may be served stale: its expiry plus the type's grace period,
+    but never past the JWT's own exp claim, after which the provider rejects it.
+    """
+    until = expires + stale_grace(type)
+    expiry = token_expiry(token)
+    return min(until, expiry) if expiry else until
 
-def save_token(db, email, token, type: str):
+def sweep_targets(legacy: bool = False):
     """
-    Save a token to Firebase collection "tokens" with the given email as document ID.
+    Collections cleaned up by the sweeper, with the timestamp field compared and how far
+    in the past it may be. Tokens are kept through their stale grace period.
+
+    Args:
+        legacy (bool): Also delete token records saved before expiries were stored once their
+                       fixed lifetime has passed. This reads every old token record, so it is
+                       for a one-off pass (python sweeper.py --legacy), not the regular sweep.
+    """
+    def tokens(type: str) -> tuple:
+        target = ("expires", stale_grace(type))
+        return target + (token_ttl(type) + stale_grace(type),) if legacy else target
+
+    return {
+        "tokensextend": tokens("extend"),
+        "tokensprivacy": tokens("privacy"),
+        "otp": ("age", timedelta(minutes=OTP_EXP))
+    }
+
+_db = None
+_db_lock = threading.Lock()
+
+def get_db():
+    """
+    Return the process-wide Firestore client, creating it from service.json on first use.
+    The client is thread-safe and shared by every request.
+    """
+    global _db
+
+    if _db is None:
+        with _db_lock:
+            if _db is None:
+                creds = service_account.Credentials.from_service_account_file("service.json")
+                _db = firestore.Client(credentials=creds)
+
+    return _db
+
+storage_io.configure(STORAGE_THREADS)
+
+token_store = create_store(TOKEN_STORE, get_db=get_db, path=TOKEN_STORE_PATH)
+
+jobs = JobStore(max_size=JOBS_MAX, get_db=get_db if JOBS_FIRESTORE else None)
+
+sweeper = Sweeper(
+    token_store,
+    sweep_targets(),
+    interval=SWEEP_INTERVAL,
+    batch_size=SWEEP_BATCH_SIZE,
+    max_deletes_per_sec=SWEEP_MAX_DELETES_PER_SEC
+)
+
+def close_db():
+    """
+    Close the token store and the shared Firestore client and its gRPC channels.
+    """
+    global _db
+
+    token_store.close()
+    storage_io.shutdown()
+
+    with _db_lock:
+        if _db is not None:
+            try:
+                _db.close()
+            except Exception as e:
+                print(f"Error closing database: {e}")
+            _db = None
+
+atexit.register(close_db)
+
+def save_token(store, email, token, type: str):
+    """
+    Save a token for the given merchant type and email.
     
     Args:
-        db: Firebase database instance
-        email (str): Email address to use as document ID
+        store: Token store
+        email (str): Email address the token belongs to
         token (str): Token string to save
     """
     try:
         current_time = datetime.now(timezone.utc)
-        
-        token_data = {
-            "token": token,
-            "age": current_time
-        }
-        
-        token_doc_ref = db.collection(f'tokens{type.lower()}').document(email)
-        token_doc_ref.set(token_data)
+        expires = token_expires(type, token, current_time)
+
+        store.save_token(type, email, token, current_time, expires)
+
+        token_cache.put(type, email, token, expires, current_time)
         
         print(f"Token saved successfully for {email}")
     except Exception as e:
         print(f"Error saving token to database: {e}")
         raise e
 
-def check_db(db, email: str, type: str) -> Optional[str]:
+def check_db(store, email: str, type: str, cleanup: bool = True) -> Optional[str]:
     """
-    Check Firebase collection "tokens" for a document with the given email ID.
+    Check the token store for a token for the given email.
+    The in-process token cache is consulted first; the store is only read on a miss.
     
     Args:
-        db: Firebase database instance
-        email (str): Email address to use as document ID
+        store: Token store
+        email (str): Email address the token belongs to
+        cleanup (bool): Delete a leftover OTP code when no token exists and no login for the email is running
     
     Returns:
-        str: Token string if found and within 5 minutes, None otherwise
+        str: Token string if found and not past its expiry, None otherwise
     """
+    cached = token_cache.get(type, email)
+    if cached:
+        return cached
+
     try:
-        # Check tokens collection for document with email as ID
-        token_doc_ref = db.collection(f'tokens{type.lower()}').document(email)
-        token_doc = token_doc_ref.get()
+        record = store.get_token(type, email)
         
-        if token_doc.exists:
-            data = token_doc.to_dict()
-            age = data.get("age")  # Firebase timestamp
-            token = data.get("token")  # String
+        if record:
+            age = record.get("age")  # Firebase timestamp or datetime
+            token = record.get("token")  # String
             
             if age and token:
-                # Convert Firebase timestamp to datetime
-                age_datetime = age.replace(tzinfo=timezone.utc) if age.tzinfo is None else age
-                current_time = datetime.now(timezone.utc)
-                
-                # Check if age is within 5 minutes
-                time_diff = current_time - age_datetime
-
-                TOKEN_EXP = TOKEN_EXP_EXTEND if type.lower() == "extend" else TOKEN_EXP_PRIVACY
+                expires = record_expires(type, record)
 
-                if time_diff <= timedelta(minutes=TOKEN_EXP):
-                    # Token is fresh, return it
+                if datetime.now(timezone.utc) < expires:
+                    # Token is fresh, remember it locally and return it
+                    token_cache.put(type, email, token, expires, as_utc(age))
                     return token
                 else:
-                    # Token is expired, delete the document
-                    token_doc_ref.delete()
+                    # Token is expired; the sweeper deletes it, save_token overwrites it sooner
                     return None
             else:
-                # Missing required fields, delete the document
-                token_doc_ref.delete()
+                # Missing required fields, delete the record
+                store.delete_token(type, email)
                 return None
+        elif cleanup and not login_in_flight(email):
+            # No token, clean up a leftover OTP code if there is one
+            store.delete_otp(email)
+            return None
         else:
-            # Token document not found, check and cleanup OTP document if exists
-            otp_doc_ref = db.collection("otp").document(email)
-            otp_doc = otp_doc_ref.get()
-            
-            if otp_doc.exists:
-                otp_doc_ref.delete()
-            
             return None
             
     except Exception as e:
         print(f"Error checking database: {e}")
         return None
 
-async def get_otp_code_async(email: str, db, timeout: int = 120) -> Optional[str]:
+def check_db_many(store, accounts) -> dict:
     """
-    Asynchronous version of OTP polling function.
+    Look up fresh tokens for many accounts with a single bulk read from the store.
+    The in-process token cache is consulted first and filled from the results. Nothing is deleted.
     
     Args:
-        email (str): The email address to look up the OTP for
-        db: Database instance
-        timeout (int): Maximum time to wait in seconds (default: 120)
+        store: Token store
+        accounts: Iterable of (email, type) pairs
     
     Returns:
-        str: The OTP code if found, None if timeout reached or error occurred
+        dict: (type lowercased, email) -> token for every account with a fresh token
     """
-    start_time = asyncio.get_event_loop().time()
-    
-    while asyncio.get_event_loop().time() - start_time < timeout:
-        try:
-            # Get document from Firestore
-            doc_ref = db.collection("otp").document(email)
-            doc = doc_ref.get()
-            
-            if doc.exists:
-                data = doc.to_dict()
-                otp = data.get("otp")
-                doc_ref.delete()
-
-                if otp:
-                    print("\nGot otp code: " + otp)
-                    return otp
-            
-            # Wait 1 second before next poll (using async sleep)
-            await asyncio.sleep(1)
-            
-        except Exception as e:
-            print(f"Error polling for OTP: {e}")
-            await asyncio.sleep(2)
+    tokens = {}
+    misses = {}
+
+    for email, type in accounts:
+        key = (type.lower(), email)
+        if key in tokens or key in misses:
             continue
-    
-    # Timeout reached
-    return None
 
-async def privacy_auth(db, email, password, retry_count=0):
+        cached = token_cache.get(type, email)
+        if cached:
+            tokens[key] = cached
+        else:
+            misses[key] = (type, email)
+
+    if not misses:
+        return tokens
+
+    try:
+        for (type, email), record in store.get_tokens(misses.values()).items():
+            age = record.get("age")
+            token = record.get("token")
+
+            if not (age and token):
+                continue
+
+            expires = record_expires(type, record)
+
+            if datetime.now(timezone.utc) < expires:
+                token_cache.put(type, email, token, expires, as_utc(age))
+                tokens[(type, email)] = token
+    except Exception as e:
+        print(f"Error bulk checking database: {e}")
+
+    return tokens
+
+def check_db_stale(store, email: str, type: str) -> Optional[str]:
     """
-    Authenticate with Extend using Camoufox browser automation with proxy support.
-    Includes OTP handling and retry logic for retryable errors.
+    Look up a token that is past its expiry but still within the type's stale grace period
+    and its own exp claim. Nothing is deleted.
     
     Args:
-        db: Database instance
-        email (str): Login email
-        password (str): Login password
-        retry_count (int): Current retry attempt (internal use)
+        store: Token store
+        email (str): Email address the token belongs to
+        type (str): Merchant type
     
     Returns:
-        str: Authentication token if successful, None otherwise
+        str: Token string if found and within stale_until(), None otherwise
     """
-    max_retries = 1
-    
-    proxy_settings = get_proxy_settings()
-    if not proxy_settings:
-        print("No proxy available")
-    
+    cached = token_cache.peek(type, email)
+    if cached and datetime.now(timezone.utc) <= stale_until(type, cached[0], cached[2]):
+        return cached[0]
+
     try:
-        config = {
-            "humanize": False
-        }
-        
-        async with AsyncCamoufox(
-            proxy=proxy_settings,
-            geoip=True,
-            config=config,
-            headless=True if TEST_MODE else "virtual",
-            firefox_user_prefs={
-                "media.peerconnection.enabled": False
-            }
-        ) as browser:
-            try:
-                # Launch browser and create new page
-                page = await browser.new_page()
-                
-                # Navigate to the signin page
-                await page.goto("https://app.privacy.com/login", wait_until="load")
-               
-                # Wait for email field and fill it
-                email_field = page.locator('[name="email"]')
-                await email_field.wait_for(timeout=20000)
-                await email_field.hover()
-                await email_field.click()
-                await asyncio.sleep(0.2)
-                await email_field.press_sequentially(email, delay=random.uniform(5, 10))
-                
-                # Wait for password field and fill it
-                password_field = page.locator('[name="password"]')
-                await password_field.wait_for(timeout=10000)
-                await password_field.hover()
-                await password_field.click()
-                await asyncio.sleep(0.2)
-                await password_field.press_sequentially(password, delay=random.uniform(5, 10))
-
-                await asyncio.sleep(0.25)
-                
-                # Click the continue button
-                login_btn = page.locator('button[type="submit"]')
-                await login_btn.wait_for(timeout=10000)
-                await login_btn.hover()
-                await login_btn.click()
-
-                # Check for login error element
-                try:
-                    error_element = page.locator('div[role="alert"]')
-                    await error_element.wait_for(timeout=6000)
-                    if await error_element.is_visible():
-                        error_text = await error_element.inner_text(timeout=3000)
-                        print(error_text)
-                        return f'Login Failed: {error_text}'
-                except:
-                    # No error element found, continue
-                    pass
-
-                # Get OTP code
-                otp = await get_otp_code_async(email, db)
-
-                if not otp or len(otp) != 6:
-                    # Check for login error element again
-                    try:
-                        error_element = page.locator('div[role="alert"]')
-                        if await error_element.is_visible():
-                            error_text = await error_element.inner_text(timeout=3000)
-                            print(error_text)
-                            return f'Login Failed: {error_text}'
-                    except:
-                        pass
-                
-                    print("No otp found or bad format")
-                    return None
+        record = store.get_token(type, email)
+        if not record:
+            return None
 
-                # Enter OTP to the field
-                otp_field = page.locator('[name="code0"]')
-                await otp_field.wait_for(timeout=10000)
-                await otp_field.hover()
-                await otp_field.click()
-                await asyncio.sleep(0.2)
-                await otp_field.press_sequentially(otp, delay=random.uniform(10, 20))
-                
-                await asyncio.sleep(0.25)
-
-                # Click verify/continue button
-                verify_btn = page.locator('button:has-text("Continue")')
-                await verify_btn.wait_for(timeout=10000)
-                await verify_btn.hover()
-                await verify_btn.click()
-
-                # Check for OTP error element
-                try:
-                    error_element = page.locator('div[role="alert"]')
-                    await error_element.wait_for(timeout=3000)
-                    if await error_element.is_visible():
-                        error_text = await error_element.inner_text(timeout=3000)
-                        print(error_text)
-                        return f'OTP Failed: {error_text}'
-                except:
-                    # No error element found, continue
-                    pass
-                
-                auth_token = await extract_auth_token_privacy(page)
-                return auth_token
-            
-            except Exception as page_error:
-                print(f"Page interaction error: {repr(page_error)}")
-                traceback.print_exc()
-                
-                # Check if this is a retryable error
-                if is_retryable_error(page_error) and retry_count < max_retries:
-                    print(f"Retryable error detected, retrying... (attempt {retry_count + 1})")
-                    return await extend_auth(db, email, password, retry_count + 1)
-                
-                return None
-                
+        age = record.get("age")
+        token = record.get("token")
+
+        if age and token:
+            if datetime.now(timezone.utc) <= stale_until(type, token, record_expires(type, record)):
+                return token
+
+        return None
     except Exception as e:
-        print(f"Browser automation error: {e}")
-        
-        # Check if this is a retryable error
-        if is_retryable_error(e) and retry_count < max_retries:
-            print(f"Retryable error detected, retrying... (attempt {retry_count + 1})")
-            return await extend_auth(db, email, password, retry_count + 1)
-        
+        print(f"Error checking database for stale token: {e}")
         return None
 
-async def extract_auth_token_privacy(page) -> Optional[str]:
+def acquire_auth_lease(store, email: str, type: str) -> bool:
     """
-    Extract JWT authentication token from browser cookies on app.privacy.com.
-    Polls cookies every 2 seconds for up to 30 seconds.
+    Try to take the cross-instance lease for logging in to an account.
     
     Args:
-        page: Camoufox/Playwright page instance
+        store: Token store
+        email (str): Account email
+        type (str): Merchant type
+    
     Returns:
-        str: JWT token if found, None otherwise
+        bool: True if this instance now holds the lease, False if another live instance does
     """
     try:
-        max_attempts = 15  # 15 attempts * 2 seconds = 30 seconds
-        attempt = 0
-
-        while attempt < max_attempts:
-            try:
-                # Get cookies from the current page context
-                cookies = await page.context.cookies()
-                
-                # Look for the "token" cookie on app.privacy.com
-                for cookie in cookies:
-                    if cookie.get("name") == "token" and "app.privacy.com" in cookie.get("domain", ""):
-                        jwt_token = cookie.get("value", "")
-                        if jwt_token:
-                            print(f"Found JWT token: {jwt_token[:20]}...")
-                            return jwt_token
-                
-                # Wait 2 seconds before next attempt
-                await asyncio.sleep(2.0)
-                attempt += 1
-            
-            except Exception as eval_error:
-                print(f"Error checking cookies: {eval_error}")
-                await asyncio.sleep(2.0)
-                attempt += 1
-                continue
-
-        print("No JWT token found in cookies after polling")
-        return None
+        return store.acquire_lease(f"{type.lower()}:{email}", INSTANCE_ID, timedelta(seconds=AUTH_LEASE_TTL))
+    except Exception as e:
+        # Never block a login because the lease could not be read
+        print(f"Error acquiring auth lease: {e}")
+        return True
 
+def release_auth_lease(store, email: str, type: str):
+    """
+    Drop the account's lease if this instance owns it.
+    """
+    try:
+        store.release_lease(f"{type.lower()}:{email}", INSTANCE_ID)
     except Exception as e:
-        print(f"Error extracting auth token: {e}")
-        return None
+        print(f"Error releasing auth lease: {e}")
 
-async def extend_auth(db, email, password, retry_count=0):
+async def get_otp_code_async(email: str, store, timeout: int = 120) -> Optional[str]:
     """
-    Authenticate with Extend using Camoufox browser automation with proxy support.
-    Includes OTP handling and retry logic for retryable errors.
+    Wait for the OTP code for an email. How codes arrive depends on the store;
+    Firestore pushes them through a shared listener.
     
     Args:
-        db: Database instance
-        email (str): Login email
-        password (str): Login password
-        retry_count (int): Current retry attempt (internal use)
+        email (str): The email address to look up the OTP for
+        store: Token store
+        timeout (int): Maximum time to wait in seconds (default: 120)
     
     Returns:
-        str: Authentication token if successful, None otherwise
+        str: The OTP code if found, None if timeout reached or error occurred
     """
-    max_retries = 1
-    
-    proxy_settings = get_proxy_settings()
-    if not proxy_settings:
-        print("No proxy available")
-    
-    try:
-        config = {
-            "humanize": False
-        }
-        
-        async with AsyncCamoufox(
-            proxy=proxy_settings,
-            geoip=True,
-            config=config,
-            headless=True if TEST_MODE else "virtual",
-            firefox_user_prefs={
-                "media.peerconnection.enabled": False
-            }
-        ) as browser:
-            try:
-                # Launch browser and create new page
-                page = await browser.new_page()
-                
-                # Navigate to the signin page
-                await page.goto("https://app.paywithextend.com/signin", wait_until="load")
-               
-                # Wait for email field and fill it
-                email_field = page.locator('#email')
-                await email_field.wait_for(timeout=20000)
-                await email_field.hover()
-                await email_field.click()
-                await email_field.press_sequentially(email, delay=random.uniform(5, 10))
-                
-                # Wait for password field and fill it
-                password_field = page.locator('#loginPwd')
-                await password_field.wait_for(timeout=10000)
-                await password_field.hover()
-                await password_field.click()
-                await password_field.press_sequentially(password, delay=random.uniform(5, 10))
-
-                await asyncio.sleep(0.25)
-                
-                # Click the continue button
-                login_btn = page.locator('#loginBtn')
-                await login_btn.wait_for(timeout=10000)
-                await login_btn.hover()
-                await login_btn.click()
-
-                # Check for login error element
-                try:
-                    error_elements = page.locator('//span[@data-testid="signInError"]')
-                    await error_elements.wait_for(timeout=6000)
-                    if await error_elements.is_visible():
-                        error_text = await error_elements.inner_text(timeout=3000)
-                        print(error_text)
-                        return f'Login Failed: {error_text}'
-                except:
-                    # No error element found, continue
-                    pass
-
-                # Get OTP code
-                otp = await get_otp_code_async(email, db)
-
-                if not otp or len(otp) != 6:
-                    # Check for login error element again
-                    try:
-                        error_elements = page.locator('//span[@data-testid="signInError"]')
-                        if await error_elements.is_visible():
-                            error_text = await error_elements.inner_text(timeout=3000)
-                            print(error_text)
-                            return f'Login Failed: {error_text}'
-                    except:
-                        pass
-                
-                    print("No otp found or bad format")
-                    return None
+    return await store.wait_otp(email, timeout)
 
-                # Enter OTP to the field using XPath
-                otp_field = page.locator('//*[@id="content"]/div/div[1]/div/div[4]/div[1]/form/div[1]/input')
-                await otp_field.wait_for(timeout=10000)
-                await otp_field.hover()
-                await otp_field.click()
-                await otp_field.press_sequentially(otp, delay=random.uniform(10, 20))
-                
-                await asyncio.sleep(0.25)
-
-                # Click verify button
-                verify_btn = page.locator('#verifyCodeBtn')
-                await verify_btn.wait_for(timeout=10000)
-                await verify_btn.hover()
-                await verify_btn.click()
-
-                # Check for otp error element
-                try:
-                    error_elements = page.locator('//*[@id="content"]/div/div[1]/div/div[4]/div[1]/form/div[1]/div/span')
-                    await error_elements.wait_for(timeout=3000)
-                    if await error_elements.is_visible():
-                        error_text = await error_elements.inner_text(timeout=3000)
-                        print(error_text)
-                        return f'OTP Failed: {error_text}'
-                except:
-                    # No error element found, continue
-                    pass
-                
-                auth_token = await extract_auth_token_extend(page)
+def get_proxy_settings():
+    """
+    Get proxy configuration in Camoufox format from the health-scored proxy pool.
+    Returns proxy settings dict or None if no proxy available.
+    """
+    return proxy_pool.pick()
+
+proxy_affinity = ProxyAffinity(
+    proxy_pool,
+    ttl=timedelta(minutes=PROXY_AFFINITY_TTL),
+    get_db=get_db if PROXY_AFFINITY_FIRESTORE else None
+)
+
+def report_launch_error(launch_options: dict, error: Exception):
+    # A browser that fails or times out launching has not loaded a page yet, so blame the proxy
+    # (a launch timeout's message is empty and would not match is_retryable_error)
+    proxy_pool.report_failure(launch_options.get("proxy"))
+
+sessions = SessionStore(SESSION_KEY, backend=SESSION_STORE, directory=SESSION_DIR, get_db=get_db) if SESSION_KEY else None
+
+cognito = CognitoRefresher(store=sessions, secret=SESSION_KEY.encode() if SESSION_KEY else None)
+
+async def remember_refresh_token(provider: str, email: str, password: str, access_token: str, refresh_token: str):
+    if HTTP_REFRESH_ENABLED and provider == "extend":
+        await cognito.remember(email, password, access_token, refresh_token)
+
+login_flow = LoginFlow(
+    browser_pool,
+    get_otp_code_async,
+    report=jobs.report,
+    sessions=sessions,
+    on_refresh_token=remember_refresh_token,
+    lean=LEAN_PAGES,
+    proxies=proxy_pool,
+    affinity=proxy_affinity
+)
+
+async def _login(store, email, password, type: str):
+    """
+    Run the browser login, limited to AUTH_CONCURRENCY at a time
+    and cancelled after AUTH_TIMEOUT seconds.
+
+    Raises:
+        AdmissionRejected: The login needs a browser and the queue for one is full
+    """
+    global auth_in_flight
+
+    provider = provider_for(type)
+
+    with trace_login(provider, email) as outcome:
+        # A refresh token from an earlier login renews Extend tokens without a browser
+        if HTTP_REFRESH_ENABLED and provider == "extend":
+            auth_token = await cognito.refresh(email, password)
+            checkpoint("http_refresh")
+            if auth_token:
+                outcome["value"] = "ok"
                 return auth_token
-            
-            except Exception as page_error:
-                print(f"Page interaction error: {repr(page_error)}")
-                traceback.print_exc()
-                
-                # Check if this is a retryable error
-                if is_retryable_error(page_error) and retry_count < max_retries:
-                    print(f"Retryable error detected, retrying... (attempt {retry_count + 1})")
-                    return await extend_auth(db, email, password, retry_count + 1)
-                
-                return None
-                
-    except Exception as e:
-        print(f"Browser automation error: {e}")
-        
-        # Check if this is a retryable error
-        if is_retryable_error(e) and retry_count < max_retries:
-            print(f"Retryable error detected, retrying... (attempt {retry_count + 1})")
-            return await extend_auth(db, email, password, retry_count + 1)
-        
-        return None
 
-async def extract_auth_token_extend(page) -> Optional[str]:
+        # Only logins that need a browser queue for one; callers sharing this login share its slot
+        if admission_waits.get():
+            await admission.enter()
+        elif not admission.try_enter():
+            outcome["value"] = "shed"
+            raise AdmissionRejected(admission.retry_after())
+
+        try:
+            async with auth_semaphore:
+                checkpoint("queue")
+                auth_in_flight += 1
+                jobs.report("login started", "running")
+                started = asyncio.get_running_loop().time()
+                try:
+                    coro = login_flow.run(PROVIDERS[provider], store, email, password)
+                    auth_token = await asyncio.wait_for(coro, timeout=AUTH_TIMEOUT)
+                finally:
+                    auth_in_flight -= 1
+                    admission.observe(asyncio.get_running_loop().time() - started)
+        finally:
+            admission.leave()
+
+        if auth_token:
+            outcome["value"] = "rejected" if is_auth_failure(auth_token) else "ok"
+
+        return auth_token
+
+async def _leased_login(store, email, password, type: str):
     """
-    Extract authentication token from the page using the same method as Swift code.
-    Polls localStorage every 2 seconds looking for Cognito access token.
-    Args:
-        page: Camoufox page instance
-    Returns:
-        str: Authentication token if found, None otherwise
+    Log in while holding the account's lease in the token store. If another instance holds it,
+    wait for that instance's token instead of starting a competing login.
     """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + AUTH_LEASE_TTL
+
+    while not await run_io(acquire_auth_lease, store, email, type):
+        if loop.time() > deadline:
+            return None
+
+        await asyncio.sleep(AUTH_LEASE_POLL)
+
+        # Leave the OTP document alone, the lease holder is waiting on it
+        token = await run_io(check_db, store, email, type, False)
+        if token:
+            return token
+
     try:
-        js_script = """
-        (function() {
-            function lookup(suffix) {
-                var key = Object.keys(localStorage).find(function(key) {
-                    return key.startsWith("CognitoIdentityServiceProvider") && key.endsWith(suffix);
-                });
-                if (!key) return null;
-                return localStorage[key];
-            }
-            var accessToken = lookup("accessToken");
-            return JSON.stringify({
-                accessToken: accessToken
-            });
-        })()
-        """
-        
-        # Poll for access token every 2 seconds for up to 60 seconds
-        max_attempts = 15  # 15 attempts * 2 seconds = 30 seconds
-        attempt = 0
-        
-        while attempt < max_attempts:
-            try:
-                # Execute the JavaScript to look for the access token
-                result = await page.evaluate(js_script)
-                
-                if result:
-                    try:
-                        # Handle case where result might already be parsed
-                        if isinstance(result, dict):
-                            access_token = result.get("accessToken", "")
-                        else:
-                            token_data = json.loads(result)
-                            access_token = token_data.get("accessToken", "")
-                        
-                        if access_token:
-                            print(f"Found access token: {access_token[:20]}...")
-                            return access_token
-                    except (json.JSONDecodeError, TypeError) as parse_error:
-                        print(f"Error parsing result: {parse_error}")
-                        pass
-                
-                # Wait 2 seconds before next attempt (using async sleep)
-                await asyncio.sleep(2.0)
-                attempt += 1
-                
-            except Exception as eval_error:
-                print(f"Error evaluating JavaScript: {eval_error}")
-                await asyncio.sleep(2.0)
-                attempt += 1
-                continue
-        
-        print("No Cognito access token found after polling")
+        return await _login(store, email, password, type)
+    finally:
+        await run_io(release_auth_lease, store, email, type)
+
+def auth_key(type: str, email: str, password: str) -> tuple:
+    """
+    Single-flight key of a login. Includes a digest of the password so a caller
+    never shares the result of a login made with someone else's password.
+    """
+    return (type.lower(), email, hashlib.sha256(password.encode()).hexdigest())
+
+def login_in_flight(email: str) -> bool:
+    """
+    Whether this instance is logging in to any account with this email, which may be
+    waiting on the email's OTP code.
+    """
+    return any(key[1] == email for key in auth_flights.keys())
+
+async def run_auth(store, email, password, type: str):
+    """
+    Run one auth on the shared loop. Concurrent requests for the same (type, email, password)
+    share a single login and receive the same token or error; every job among them gets its progress.
+    """
+    login = _leased_login if AUTH_LEASES else _login
+    key = auth_key(type, email, password)
+
+    async def lead():
+        current_flight.set(key)
+        return await login(store, email, password, type)
+
+    job = current_job.get()
+    if job is None:
+        return await auth_flights.do(key, lead)
+
+    if key in auth_flights.keys():
+        jobs.progress(job, "joined a login already in progress", "running")
+
+    jobs.follow(key, job)
+    try:
+        return await auth_flights.do(key, lead)
+    finally:
+        jobs.unfollow(key, job)
+
+def is_auth_failure(auth_token: str) -> bool:
+    return "Login Failed" in auth_token or "OTP Failed" in auth_token
+
+async def refresh_token(type: str, email: str, password: str) -> Optional[str]:
+    """
+    Log in again in the background and store the new token. Skipped while the login
+    queue is full; accounts whose credentials are rejected are dropped from the refresh schedule.
+    """
+    store = token_store
+
+    try:
+        auth_token = await run_auth(store, email, password, type)
+    except AdmissionRejected:
+        print(f"Login queue full, skipping refresh for {email}")
         return None
-        
-    except Exception as e:
-        print(f"Error extracting auth token: {e}")
+
+    if not auth_token:
         return None
 
-def get_proxy_settings():
+    if is_auth_failure(auth_token):
+        print(f"Refresh rejected for {email}: {auth_token}")
+        refresher.forget(type, email)
+        return None
+
+    await run_io(save_token, store, email, auth_token, type)
+    return auth_token
+
+refresher = RefreshScheduler(
+    refresh_token,
+    token_cache.lifetime,
+    fraction=REFRESH_AT,
+    concurrency=REFRESH_CONCURRENCY,
+    idle_after=timedelta(minutes=REFRESH_IDLE)
+)
+
+def run_async_auth(store, email, password, type: str):
     """
-    Get proxy configuration in Camoufox format.
-    Returns proxy settings dict or None if no proxy available.
+    Wrapper function to submit an auth to the shared event loop and wait for its result.
+    The calling thread only waits; the auth itself shares the loop with every other request.
     """
-    proxy = random_proxy()  # Your existing random_proxy() function
-    if not proxy:
+    try:
+        future = asyncio.run_coroutine_threadsafe(run_auth(store, email, password, type), get_loop())
+        return future.result()
+    except asyncio.TimeoutError:
+        raise
+    except Exception as e:
+        print(f"Error running async auth: {e}")
         return None
-    
-    # Parse proxy using your existing function
-    ip, port, username, proxyPass = parse_proxy(proxy)
-    proxy_url = f"http://{ip}:{port}"
-    
-    proxy_settings = {
-        "server": proxy_url,
-        "username": username,
-        "password": proxyPass
-    }
-    
-    return proxy_settings
 
-def is_retryable_error(error) -> bool:
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    body, content_type = metrics.render()
+    return Response(body, headers={"Content-Type": content_type})
+
+@app.route('/stats', methods=['GET'])
+def stats():
+    return jsonify({
+        "browser_pool": browser_pool.stats(),
+        "token_cache": token_cache.stats(),
+        "auth_flights": auth_flights.stats(),
+        "token_store": token_store.stats(),
+        "storage_io": storage_io.stats(),
+        "sweeper": sweeper.stats(),
+        "refresher": refresher.stats(),
+        "jobs": jobs.stats(),
+        "sessions": sessions.stats() if sessions else None,
+        "cognito": cognito.stats(),
+        "proxies": proxy_pool.stats(),
+        "proxy_affinity": proxy_affinity.stats(),
+        "admission": admission.stats(),
+        "auths": {
+            "in_flight": auth_in_flight,
+            "limit": AUTH_CONCURRENCY
+        }
+    }), 200
+
+def receive_otp():
+    """
+    Store an OTP code for the login waiting on it. For token stores other than
+    Firestore, where the mail pipeline writes codes to the otp collection directly.
+    Requires OTP_SECRET in the X-OTP-Secret header.
+    """
+    if not hmac.compare_digest(request.headers.get("X-OTP-Secret", "").encode(), OTP_SECRET.encode()):
+        return jsonify({"error": "Unauthorized"}), 401
+
+    params = request_params()
+    email = params.get('email')
+    otp = params.get('otp')
+
+    if not email or not otp:
+        return jsonify({"error": "email and otp invalid"}), 500
+
+    try:
+        token_store.put_otp(email, str(otp))
+    except Exception as e:
+        print(f"Error storing OTP: {e}")
+        return jsonify({"error": str(e)}), 500
+
+    return jsonify({"status": "stored"}), 200
+
+if token_store.backend != "firestore" and OTP_SECRET:
+    app.add_url_rule('/otp', view_func=receive_otp, methods=['POST'])
+elif token_store.backend != "firestore":
+    print("OTP_SECRET not set, POST /otp is disabled")
+
+def request_params():
+    if request.method == 'GET':
+        return request.args
+    return request.json if request.is_json else request.form
+
+def is_truthy(value) -> bool:
+    return str(value).lower() in ("1", "true")
+
+def validate_auth_params(params):
     """
-    Determine if an error is retryable.
+    Returns:
+        tuple: (email, password, type, error response or None)
+    """
+    email = params.get('email')
+    password = params.get('password')
+
+    if not email or not password:
+        return email, password, None, (jsonify({"error": "email and password invalid"}), 500)
     
-    Args:
-        error: Exception object
+    type = params.get('type')
+
+    if not type:
+        return email, password, type, (jsonify({"error": "Merchant type not included"}), 500)
+
+    return email, password, type, None
+
+def resolve_cached(store, email, password, type, params):
+    """
+    Answer an auth request from the token caches without logging in.
     
     Returns:
-        bool: True if error is retryable, False otherwise
-    """
-    error_str = str(error).lower()
-    retryable_errors = [
-        'timeout',
-        'network',
-        'connection',
-        'proxy',
-        'dns',
-        'ssl',
-        'tls',
-        'browser disconnected',
-        'page crashed',
-        'navigation timeout',
-        'target closed'  # Added for Playwright/Camoufox specific errors
-    ]
-    
-    return any(retryable_error in error_str for retryable_error in retryable_errors)
+        tuple: (response body, status code), or None if a login is needed
+    """
+    if REFRESH_ENABLED and is_truthy(params.get('refresh', '')):
+        refresher.track(type, email, password)
+        # Make sure the loop (and the refresh scheduler on it) is running even on cache hits
+        get_loop()
+
+    auth_token = check_db(store, email, type)
+
+    if auth_token:
+        count_request(provider_for(type), "cache")
+        return {"access_token": auth_token}, 200
+
+    stale = params.get('stale')
+    if stale is None:
+        allow_stale = STALE_BY_DEFAULT.get(type.lower(), False)
+    else:
+        allow_stale = is_truthy(stale)
 
-def run_async_auth(db, email, password, type: str):
+    if allow_stale:
+        stale_token = check_db_stale(store, email, type)
+        if stale_token:
+            # Serve it now and log in again in the background
+            asyncio.run_coroutine_threadsafe(refresh_token(type, email, password), get_loop())
+            count_request(provider_for(type), "stale")
+            return {"access_token": stale_token, "stale": True}, 200
+
+    return None
+
+def auth_response(body: dict, status_code: int):
     """
-    Wrapper function to run async extend_auth in a new event loop
+    JSON response for an auth result; a 429 from a full login queue carries Retry-After.
     """
+    response = jsonify(body)
+    if status_code == 429:
+        response.headers["Retry-After"] = str(body["retry_after"])
+    return response, status_code
+
+async def login_and_save(store, email, password, type):
+    """
+    Log in on the shared loop and store the new token.
+    
+    Returns:
+        tuple: (response body, status code); 429 with "retry_after" if the login queue is full
+    """
+    count_request(provider_for(type), "login")
+
     try:
-        # Create a new event loop for this thread
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            if type.lower() == "extend":
-                return loop.run_until_complete(extend_auth(db, email, password))
-            else:
-                return loop.run_until_complete(privacy_auth(db, email, password))
-        finally:
-            loop.close()
+        auth_token = await run_auth(store, email, password, type)
+    except AdmissionRejected as e:
+        count_request(provider_for(type), "shed")
+        return {"error": "Too many logins queued, retry later", "retry_after": e.retry_after}, 429
+    except asyncio.TimeoutError:
+        return {"error": "Authentication timeout after 3 minutes"}, 408
     except Exception as e:
         print(f"Error running async auth: {e}")
-        return None
+        auth_token = None
+
+    if not auth_token:
+        return {"error": "Failed to auth"}, 500
+
+    if "Login Failed" in auth_token:
+        return {"error": auth_token}, 401
+    if "OTP Failed" in auth_token:
+        return {"error": auth_token}, 402
+
+    await run_io(save_token, store, email, auth_token, type)
+
+    return {"access_token": auth_token}, 200
+
+async def run_job(job, store, email, password, type):
+    """
+    Run a login submitted through the job API and record its result on the job.
+    """
+    current_job.set(job)
+    try:
+        body, status_code = await login_and_save(store, email, password, type)
+    except Exception as e:
+        body, status_code = {"error": str(e)}, 500
+
+    jobs.finish(job, body, status_code)
+
+def submit_job(store, email, password, type, params):
+    """
+    Create a job for an auth request. Cache hits finish immediately,
+    misses are logged in on the shared loop in the background.
+    
+    Returns:
+        Job: The new job
+    """
+    job = jobs.create(type, email)
+
+    cached = resolve_cached(store, email, password, type, params)
+    if cached:
+        jobs.finish(job, *cached)
+    else:
+        asyncio.run_coroutine_threadsafe(run_job(job, store, email, password, type), get_loop())
+
+    return job
 
 @app.route('/authtask', methods=['GET', 'POST', 'OPTIONS'])
 def authtask():
@@ -645,63 +918,188 @@ def authtask():
         return response
     
     try:
-        creds = service_account.Credentials.from_service_account_file("service.json")
-        db = firestore.Client(credentials=creds)
+        store = token_store
 
-        if request.method == 'GET':
-            params = request.args
-        else:
-            params = request.json if request.is_json else request.form
-        
-        email = params.get('email')
-        password = params.get('password')
+        params = request_params()
+        email, password, type, error = validate_auth_params(params)
 
-        if not email or not password:
-            return jsonify({"error": "email and password invalid"}), 500
-        
-        type = params.get('type')
+        if error:
+            return error
 
-        if not type:
-            return jsonify({"error": "Merchant type not included"}), 500
+        if is_truthy(request.args.get('async', params.get('async', ''))):
+            job = submit_job(store, email, password, type, params)
+            return jsonify({
+                "job_id": job.id,
+                "status": job.status,
+                "status_url": f"/authtask/{job.id}",
+                "events_url": f"/authtask/{job.id}/events"
+            }), 202
 
-        auth_token = check_db(db, email, type)
+        cached = resolve_cached(store, email, password, type, params)
 
-        if auth_token:
-            return jsonify({"access_token": auth_token}), 200
-        
+        if cached:
+            body, status_code = cached
+            return jsonify(body), status_code
+
+        # Cache hits never queue; a login that needs a browser is turned away quickly once the queue is full
+        future = asyncio.run_coroutine_threadsafe(login_and_save(store, email, password, type), get_loop())
+        body, status_code = future.result()
+
+        return auth_response(body, status_code)
+
+    except Exception as e:
+        print("Exception caught in auth: " + str(e))
+        return jsonify({"error": str(e)}), 500
+
+async def run_batch(store, accounts, results: queue.Queue):
+    """
+    Log in to every account in a batch, at most BATCH_CONCURRENCY at once and
+    BATCH_TYPE_CONCURRENCY per merchant type, putting each result on the queue as it finishes.
+    Accounts wait for the login queue rather than being turned away.
+    
+    Args:
+        accounts: List of (index, email, password, type) tuples
+        results: Queue receiving one dict per account
+    """
+    batch_slots = asyncio.Semaphore(BATCH_CONCURRENCY)
+    type_slots = {}
+
+    async def login(index, email, password, type):
+        # Each account runs in its own task, so this only applies to this batch's logins
+        admission_waits.set(True)
+
+        slots = type_slots.setdefault(
+            type.lower(),
+            asyncio.Semaphore(BATCH_TYPE_CONCURRENCY.get(type.lower(), BATCH_CONCURRENCY))
+        )
         try:
-            # Use the wrapper function to run async code
-            auth_token = run_async_auth(db, email, password, type)
-            
-            if auth_token:
-                if "Login Failed" in auth_token:
-                    return jsonify({"error": auth_token}), 401
-                if "OTP Failed" in auth_token:
-                    return jsonify({"error": auth_token}), 402
+            # Take the per-type slot first so a saturated type does not hold global slots
+            async with slots, batch_slots:
+                body, status_code = await login_and_save(store, email, password, type)
+        except Exception as e:
+            body, status_code = {"error": str(e)}, 500
+
+        results.put({"index": index, "email": email, "type": type, "status": status_code, **body})
 
-                save_token(db, email, auth_token, type)
+    await asyncio.gather(*(login(*account) for account in accounts))
 
-                db.close()
+@app.route('/authtask/batch', methods=['POST'])
+def authtask_batch():
+    """
+    Authenticate many accounts at once. Accepts a JSON list (or {"accounts": [...]}) of
+    {email, password, type} objects and streams one NDJSON line per account as it finishes.
+    Cache hits are answered first from a single bulk read.
+    """
+    try:
+        payload = request.get_json(silent=True)
+        accounts = payload.get("accounts") if isinstance(payload, dict) else payload
 
-                return jsonify({"access_token": auth_token}), 200
+        if not isinstance(accounts, list) or not accounts:
+            return jsonify({"error": "accounts list not included"}), 500
+
+        if len(accounts) > BATCH_MAX:
+            return jsonify({"error": f"At most {BATCH_MAX} accounts per batch"}), 413
+
+        store = token_store
+
+        results = []
+        valid = []
+        for index, account in enumerate(accounts):
+            account = account if isinstance(account, dict) else {}
+            email = account.get("email")
+            password = account.get("password")
+            type = account.get("type")
+
+            if not email or not password:
+                results.append({"index": index, "email": email, "type": type, "status": 500, "error": "email and password invalid"})
+            elif not type:
+                results.append({"index": index, "email": email, "type": type, "status": 500, "error": "Merchant type not included"})
             else:
-                return jsonify({"error": "Failed to auth"}), 500
-            
-        except asyncio.TimeoutError:
-            return jsonify({"error": "Authentication timeout after 3 minutes"}), 408
+                valid.append((index, email, password, type))
+
+        tokens = check_db_many(store, [(email, type) for _, email, _, type in valid])
+
+        misses = []
+        for index, email, password, type in valid:
+            token = tokens.get((type.lower(), email))
+            if token:
+                count_request(provider_for(type), "cache")
+                results.append({"index": index, "email": email, "type": type, "status": 200, "access_token": token})
+            else:
+                misses.append((index, email, password, type))
+
+        pending = queue.Queue()
+        if misses:
+            asyncio.run_coroutine_threadsafe(run_batch(store, misses, pending), get_loop())
+
+        def stream():
+            for result in results:
+                yield json.dumps(result) + "\n"
+
+            for _ in misses:
+                yield json.dumps(pending.get()) + "\n"
+
+        return Response(stream_with_context(stream()), mimetype="application/x-ndjson")
 
     except Exception as e:
-        print("Exception caught in auth: " + str(e))
+        print("Exception caught in batch auth: " + str(e))
         return jsonify({"error": str(e)}), 500
 
+@app.route('/authtask/<job_id>', methods=['GET'])
+def authtask_status(job_id):
+    job = jobs.load(job_id)
+
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+
+    return jsonify(job), 200
+
+@app.route('/authtask/<job_id>/events', methods=['GET'])
+def authtask_events(job_id):
+    """
+    Server-sent events stream of a job's progress, ending with its result.
+    """
+    job = jobs.get(job_id)
+
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+
+    def stream():
+        seen = 0
+        while True:
+            jobs.wait(job, seen, JOB_STREAM_KEEPALIVE)
+
+            events = job.events[seen:]
+            for event in events:
+                yield f"event: progress\ndata: {json.dumps(event)}\n\n"
+            seen += len(events)
+
+            if job.finished and seen >= len(job.events):
+                yield f"event: result\ndata: {json.dumps(job.to_dict())}\n\n"
+                return
+
+            if not events:
+                yield ": keepalive\n\n"
+
+    response = Response(stream_with_context(stream()), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
 if __name__ == '__main__':
     if TEST_MODE:
-        creds = service_account.Credentials.from_service_account_file("service.json")
-        db = firestore.Client(credentials=creds)
+        store = token_store
         
         # Use the wrapper function for test mode too
-        auth_token = run_async_auth(db, "ak3zaidan@gmail.com", "2@@3Demha", TEST_TYPE)
+        auth_token = run_async_auth(store, "ak3zaidan@gmail.com", "2@@3Demha", TEST_TYPE)
         print(f"Test auth result: {auth_token}")
     else:
+        if SWEEPER_ENABLED:
+            sweeper.start()
+
+        # Start the auth loop now so the browser pool warms up before the first request arrives
+        get_loop()
+
         port = int(os.environ.get('PORT', 8080))
-        app.run(host='0.0.0.0', port=port)
+        # Request threads only wait on the shared loop; AUTH_CONCURRENCY limits the actual auths
+        app.run(host='0.0.0.0', port=port, threaded=True)
@@ -0,0 +1,97 @@
+from prometheus_client import Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+import time
+
+PHASE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 3, 5, 7.5, 10, 15, 20, 30, 45, 60, 90, 120, 180)
+
+PHASE_SECONDS = Histogram(
+    "auth_phase_seconds",
+    "Time spent in each phase of the browser login flow",
+    ["provider", "phase"],
+    buckets=PHASE_BUCKETS,
+)
+
+LOGIN_SECONDS = Histogram(
+    "auth_login_seconds",
+    "End-to-end browser login time",
+    ["provider", "outcome"],
+    buckets=PHASE_BUCKETS,
+)
+
+REQUESTS = Counter(
+    "auth_requests_total",
+    "Auth requests by how they were answered",
+    ["provider", "source"],
+)
+
+class Trace:
+    """
+    Timed phases of one login, logged as a single breakdown line when it ends.
+    """
+
+    def __init__(self, provider: str, email: str):
+        self.provider = provider.lower()
+        self.email = email
+        self.started = time.monotonic()
+        self.last = self.started
+        self.spans = []
+
+    def checkpoint(self, phase: str):
+        current_time = time.monotonic()
+        seconds = current_time - self.last
+        self.last = current_time
+
+        self.spans.append((phase, seconds))
+        PHASE_SECONDS.labels(self.provider, phase).observe(seconds)
+
+    def finish(self, outcome: str):
+        total = time.monotonic() - self.started
+        LOGIN_SECONDS.labels(self.provider, outcome).observe(total)
+
+        breakdown = " ".join(f"{phase}={seconds:.2f}s" for phase, seconds in self.spans)
+        print(f"Auth timing {self.provider} {self.email} {outcome} total={total:.2f}s {breakdown}")
+
+current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+
+@contextmanager
+def trace_login(provider: str, email: str):
+    """
+    Start a trace for the login running in the current task.
+
+    Yields:
+        dict: Set its "value" to the outcome ("ok", "rejected", "shed" or "failed"); exceptions
+              record "error" unless an outcome was set before raising
+    """
+    trace = Trace(provider, email)
+    token = current_trace.set(trace)
+    outcome = {"value": "failed"}
+    try:
+        yield outcome
+    except BaseException:
+        if outcome["value"] == "failed":
+            outcome["value"] = "error"
+        raise
+    finally:
+        current_trace.reset(token)
+        trace.finish(outcome["value"])
+
+def checkpoint(phase: str):
+    """
+    Record the time since the previous checkpoint (or the start of the login) as a phase
+    of the current login. Does nothing outside trace_login().
+    """
+    trace = current_trace.get()
+    if trace is not None:
+        trace.checkpoint(phase)
+
+def count_request(provider: str, source: str):
+    REQUESTS.labels(provider, source).inc()
+
+def render():
+    """
+    Returns:
+        tuple: (body, content type) in the Prometheus text format
+    """
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,143 @@
+from collections import deque
+from typing import Optional
+import threading
+import asyncio
+
+class OtpDispatcher:
+    """
+    Single Firestore on_snapshot watch over the "otp" collection that hands
+    codes to waiting logins.
+
+    The watch callback runs on a Firestore thread and forwards every change to
+    the event loop, where it resolves the future of the login waiting on that
+    email. Codes that arrive before anyone waits are kept until their document
+    is deleted, so a waiter sees exactly what a direct read would have returned.
+    """
+
+    def __init__(self, collection: str = "otp"):
+        self.collection = collection
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._watch = None
+        self._lock = threading.Lock()
+        self._waiters = {}
+        self._pending = {}
+
+        self.delivered = 0
+        self.errors = 0
+
+    @property
+    def running(self) -> bool:
+        """
+        Whether the watch is streaming. A watch whose stream has closed is dropped,
+        so the next waiter starts a new one or falls back to polling.
+        """
+        watch = self._watch
+        if watch is None:
+            return False
+
+        # Firestore's Watch stops being active once its stream ends or errors out
+        if getattr(watch, "is_active", True):
+            return True
+
+        with self._lock:
+            if self._watch is watch:
+                print("OTP listener stream closed")
+                self._watch = None
+                self.errors += 1
+        return False
+
+    def ensure_started(self, db, loop: asyncio.AbstractEventLoop) -> bool:
+        """
+        Start the watch if it is not already running.
+
+        Returns:
+            bool: True if the watch is running
+        """
+        with self._lock:
+            if self._watch is not None:
+                return True
+
+            try:
+                self._loop = loop
+                self._watch = db.collection(self.collection).on_snapshot(self._on_snapshot)
+                return True
+            except Exception as e:
+                print(f"Error starting OTP listener: {e}")
+                self._watch = None
+                return False
+
+    def stop(self):
+        with self._lock:
+            if self._watch is not None:
+                try:
+                    self._watch.unsubscribe()
+                except Exception as e:
+                    print(f"Error stopping OTP listener: {e}")
+                self._watch = None
+
+    def _on_snapshot(self, docs, changes, read_time):
+        # Firestore thread: hand everything to the loop
+        try:
+            for change in changes:
+                doc = change.document
+                removed = change.type.name == "REMOVED"
+                otp = None if removed else (doc.to_dict() or {}).get("otp")
+                self._loop.call_soon_threadsafe(self._dispatch, doc.id, doc.reference, otp, removed)
+        except Exception as e:
+            self.errors += 1
+            print(f"Error handling OTP snapshot: {e}")
+
+    def _dispatch(self, email: str, doc_ref, otp: Optional[str], removed: bool):
+        if removed:
+            self._pending.pop(email, None)
+            return
+
+        waiters = self._waiters.get(email)
+        while waiters:
+            future = waiters.popleft()
+            if not future.done():
+                future.set_result((doc_ref, otp))
+                self.delivered += 1
+                return
+
+        self._pending[email] = (doc_ref, otp)
+
+    async def wait(self, email: str, timeout: float):
+        """
+        Wait for the next OTP document for an email.
+
+        Args:
+            email (str): Document ID in the otp collection
+            timeout (float): Seconds to wait
+
+        Returns:
+            tuple: (document reference, otp value) or None on timeout
+        """
+        pending = self._pending.pop(email, None)
+        if pending:
+            return pending
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(email, deque()).append(future)
+
+        try:
+            return await asyncio.wait_for(future, timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            waiters = self._waiters.get(email)
+            if waiters is not None:
+                if future in waiters:
+                    waiters.remove(future)
+                if not waiters:
+                    del self._waiters[email]
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "waiting": sum(len(w) for w in self._waiters.values()),
+            "pending": len(self._pending),
+            "delivered": self.delivered,
+            "errors": self.errors,
+        }
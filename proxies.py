@@ -0,0 +1,310 @@
+from datetime import datetime, timezone, timedelta
+from typing import Callable, Optional
+import threading
+import hashlib
+import random
+import time
+import os
+
+def parse_proxy(proxy_string):
+    try:
+        host, port, username, password = proxy_string.split(':')
+        return host, port, username, password
+    except:
+        return "", "", "", ""
+
+def proxy_settings_for(proxy_string: str) -> dict:
+    """
+    Convert a host:port:user:pass line to Camoufox proxy settings.
+    """
+    ip, port, username, proxyPass = parse_proxy(proxy_string)
+
+    return {
+        "server": f"http://{ip}:{port}",
+        "username": username,
+        "password": proxyPass
+    }
+
+def proxy_key(proxy_settings: Optional[dict]) -> Optional[str]:
+    if not proxy_settings:
+        return None
+    return f"{proxy_settings.get('server')}|{proxy_settings.get('username')}"
+
+class ProxyState:
+    """
+    Health of one proxy: smoothed success rate, latency and failure cooldown.
+    """
+
+    def __init__(self, line: str):
+        self.line = line
+        self.settings = proxy_settings_for(line)
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.latency: Optional[float] = None
+        self.cooldown_until = 0.0
+
+    def success_rate(self) -> float:
+        # Laplace smoothing so new proxies start at 0.5 rather than 0 or 1
+        return (self.successes + 1) / (self.successes + self.failures + 2)
+
+    def score(self, default_latency: float) -> float:
+        latency = self.latency if self.latency is not None else default_latency
+        return self.success_rate() / max(latency, 0.1)
+
+class ProxyPool:
+    """
+    Proxies from proxies.txt with health scoring.
+
+    The file is read once and re-read when its modification time changes.
+    Proxies that fail are put on an exponentially growing cooldown; picks favour
+    the healthiest, fastest proxies while spreading load over the top few.
+    """
+
+    def __init__(
+        self,
+        path: str = "proxies.txt",
+        reload_interval: float = 5,
+        cooldown: float = 30,
+        max_cooldown: float = 900,
+        top_k: int = 3,
+        latency_alpha: float = 0.3,
+    ):
+        """
+        Args:
+            path (str): Proxy file, one host:port:user:pass per line
+            reload_interval (float): Minimum seconds between checks for file changes
+            cooldown (float): Cooldown after the first consecutive failure, doubled for each further one
+            max_cooldown (float): Upper bound on the cooldown
+            top_k (int): Number of best-scoring proxies picks are spread over
+            latency_alpha (float): Weight of the newest sample in the latency moving average
+        """
+        self.path = path
+        self.reload_interval = reload_interval
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.top_k = max(1, top_k)
+        self.latency_alpha = latency_alpha
+
+        self._lock = threading.Lock()
+        self._proxies = {}
+        self._by_key = {}
+        self._mtime = None
+        self._checked_at = 0.0
+        self._missing_logged = False
+
+    def _maybe_reload(self):
+        current_time = time.monotonic()
+        if current_time - self._checked_at < self.reload_interval and self._mtime is not None:
+            return
+        self._checked_at = current_time
+
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            if not self._missing_logged:
+                print(f'Error: {self.path} not found.')
+                self._missing_logged = True
+            self._proxies = {}
+            self._by_key = {}
+            self._mtime = None
+            return
+
+        self._missing_logged = False
+        if mtime == self._mtime:
+            return
+
+        with open(self.path, "r") as file:
+            lines = [line.strip() for line in file if line.strip()]
+
+        # Keep the health of proxies that are still listed
+        proxies = {line: self._proxies.get(line) or ProxyState(line) for line in lines}
+        self._proxies = proxies
+        self._by_key = {proxy_key(state.settings): state for state in proxies.values()}
+        self._mtime = mtime
+
+        print(f"Loaded {len(proxies)} proxies from {self.path}")
+
+    def pick(self) -> Optional[dict]:
+        """
+        Returns:
+            dict: Camoufox proxy settings for a healthy proxy, or None if none are configured
+        """
+        with self._lock:
+            self._maybe_reload()
+
+            if not self._proxies:
+                return None
+
+            states = list(self._proxies.values())
+
+            current_time = time.monotonic()
+            healthy = [s for s in states if s.cooldown_until <= current_time]
+
+            if not healthy:
+                # Everything is cooling down: use the one that comes back soonest
+                return min(states, key=lambda s: s.cooldown_until).settings
+
+            latencies = sorted(s.latency for s in healthy if s.latency is not None)
+            default_latency = latencies[len(latencies) // 2] if latencies else 1.0
+
+            ranked = sorted(healthy, key=lambda s: s.score(default_latency), reverse=True)
+            return random.choice(ranked[:self.top_k]).settings
+
+    def lookup(self, key: Optional[str]) -> Optional[dict]:
+        """
+        Settings of a listed proxy that is not cooling down, by proxy_key().
+        """
+        with self._lock:
+            self._maybe_reload()
+
+            state = self._by_key.get(key)
+            if state is None or state.cooldown_until > time.monotonic():
+                return None
+            return state.settings
+
+    def report_success(self, proxy_settings: Optional[dict], latency: Optional[float] = None):
+        with self._lock:
+            state = self._by_key.get(proxy_key(proxy_settings))
+            if state is None:
+                return
+
+            state.successes += 1
+            state.consecutive_failures = 0
+            state.cooldown_until = 0.0
+
+            if latency is not None:
+                if state.latency is None:
+                    state.latency = latency
+                else:
+                    state.latency = self.latency_alpha * latency + (1 - self.latency_alpha) * state.latency
+
+    def report_failure(self, proxy_settings: Optional[dict]):
+        with self._lock:
+            state = self._by_key.get(proxy_key(proxy_settings))
+            if state is None:
+                return
+
+            state.failures += 1
+            state.consecutive_failures += 1
+            cooldown = min(self.cooldown * 2 ** (state.consecutive_failures - 1), self.max_cooldown)
+            state.cooldown_until = time.monotonic() + cooldown
+
+            print(f"Proxy {state.settings['server']} failed {state.consecutive_failures}x, cooling down {cooldown:.0f}s")
+
+    def stats(self) -> dict:
+        with self._lock:
+            current_time = time.monotonic()
+            states = list(self._proxies.values())
+
+            return {
+                "proxies": len(states),
+                "cooling_down": sum(1 for s in states if s.cooldown_until > current_time),
+                "successes": sum(s.successes for s in states),
+                "failures": sum(s.failures for s in states),
+            }
+
+class ProxyAffinity:
+    """
+    Remembers which proxy last worked for each account so repeat logins keep the same exit IP.
+
+    Entries expire after `ttl`. Only the proxy key (server and username) is kept,
+    never the proxy password, and it is resolved back through the ProxyPool so a
+    proxy that was removed or is cooling down is not reused. An optional Firestore
+    collection shares the map between instances.
+    """
+
+    def __init__(self, proxies: ProxyPool, ttl: timedelta = timedelta(hours=24), get_db: Optional[Callable] = None, collection: str = "proxyaffinity"):
+        self.proxies = proxies
+        self.ttl = ttl
+        self.get_db = get_db
+        self.collection = collection
+
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._prune_at = 1024
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _id(type: str, email: str) -> str:
+        return hashlib.sha256(f"{type.lower()}:{email}".encode()).hexdigest()
+
+    def get(self, type: str, email: str) -> Optional[dict]:
+        """
+        Returns:
+            dict: Proxy settings that last worked for the account, or None if there is no usable one
+        """
+        account = self._id(type, email)
+        current_time = datetime.now(timezone.utc)
+
+        with self._lock:
+            entry = self._entries.get(account)
+
+        if entry is None and self.get_db:
+            try:
+                doc = self.get_db().collection(self.collection).document(account).get()
+                if doc.exists:
+                    data = doc.to_dict()
+                    entry = (data.get("proxy"), data.get("age"))
+                    with self._lock:
+                        self._entries[account] = entry
+            except Exception as e:
+                print(f"Error loading proxy affinity: {e}")
+
+        settings = None
+        if entry and entry[1] and current_time - entry[1] <= self.ttl:
+            settings = self.proxies.lookup(entry[0])
+        elif entry:
+            with self._lock:
+                if self._entries.get(account) is entry:
+                    del self._entries[account]
+
+        if settings:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return settings
+
+    def set(self, type: str, email: str, proxy_settings: Optional[dict]):
+        key = proxy_key(proxy_settings)
+        if not key:
+            return
+
+        account = self._id(type, email)
+        entry = (key, datetime.now(timezone.utc))
+
+        with self._lock:
+            self._entries[account] = entry
+            if len(self._entries) >= self._prune_at:
+                self._prune(entry[1])
+
+        if self.get_db:
+            try:
+                self.get_db().collection(self.collection).document(account).set({
+                    "proxy": key,
+                    "age": entry[1]
+                })
+            except Exception as e:
+                print(f"Error saving proxy affinity: {e}")
+
+    def _prune(self, current_time: datetime):
+        """
+        Drop expired entries. Called with the lock held whenever the map has doubled since the last prune.
+        """
+        expired = [account for account, (_, age) in self._entries.items() if not age or current_time - age > self.ttl]
+        for account in expired:
+            del self._entries[account]
+
+        self._prune_at = max(1024, 2 * len(self._entries))
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = len(self._entries)
+
+        return {
+            "accounts": size,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
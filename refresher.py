@@ -0,0 +1,134 @@
+from datetime import datetime, timezone, timedelta
+from typing import Awaitable, Callable, Optional, Tuple
+import threading
+import asyncio
+
+class RefreshScheduler:
+    """
+    Re-runs the login for opted-in accounts in the background before their token expires.
+
+    Accounts are tracked when a request opts in and dropped once they have not
+    been requested for `idle_after`. A token is refreshed once it has used
+    `fraction` of its lifetime, with at most `concurrency` refreshes running at once.
+    """
+
+    def __init__(
+        self,
+        refresh: Callable[[str, str, str], Awaitable[Optional[str]]],
+        lifetime: Callable[[str, str], Optional[Tuple[datetime, datetime]]],
+        fraction: float = 0.8,
+        concurrency: int = 2,
+        idle_after: timedelta = timedelta(minutes=30),
+        retry_delay: timedelta = timedelta(minutes=1),
+        tick: float = 5,
+    ):
+        """
+        Args:
+            refresh: Coroutine function (type, email, password) -> token or None that logs in and saves the token
+            lifetime: Returns (mint time, expiry) of the account's current token, or None if there is none
+            fraction (float): Portion of the lifetime after which a token is refreshed
+            concurrency (int): Maximum refreshes running at once
+            idle_after (timedelta): Stop refreshing accounts not requested for this long
+            retry_delay (timedelta): Wait this long before retrying a failed refresh
+            tick (float): Seconds between scans
+        """
+        self.refresh = refresh
+        self.lifetime = lifetime
+        self.fraction = fraction
+        self.concurrency = max(1, concurrency)
+        self.idle_after = idle_after
+        self.retry_delay = retry_delay
+        self.tick = tick
+
+        self._accounts = {}
+        self._lock = threading.Lock()
+        self._running = set()
+        self._retry_at = {}
+        self._semaphore = None
+        self._task = None
+
+        self.refreshed = 0
+        self.failed = 0
+
+    def track(self, type: str, email: str, password: str):
+        """
+        Opt an account in, or mark it as requested again. Safe to call from any thread.
+        """
+        with self._lock:
+            self._accounts[(type.lower(), email)] = {
+                "type": type,
+                "password": password,
+                "last_requested": datetime.now(timezone.utc)
+            }
+
+    def forget(self, type: str, email: str):
+        key = (type.lower(), email)
+        with self._lock:
+            self._accounts.pop(key, None)
+        self._retry_at.pop(key, None)
+
+    async def start(self):
+        if self._task is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            self._task = asyncio.create_task(self._loop())
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.tick)
+            try:
+                self._scan()
+            except Exception as e:
+                print(f"Error scanning refresh accounts: {e}")
+
+    def _scan(self):
+        current_time = datetime.now(timezone.utc)
+
+        with self._lock:
+            accounts = list(self._accounts.items())
+
+        for key, account in accounts:
+            if current_time - account["last_requested"] > self.idle_after:
+                self.forget(account["type"], key[1])
+                continue
+
+            if key in self._running or self._retry_at.get(key, current_time) > current_time:
+                continue
+
+            lifetime = self.lifetime(account["type"], key[1])
+            if lifetime is None:
+                continue
+
+            minted_at, expires_at = lifetime
+            if current_time - minted_at >= (expires_at - minted_at) * self.fraction:
+                self._running.add(key)
+                asyncio.create_task(self._refresh(key, account))
+
+    async def _refresh(self, key, account):
+        email = key[1]
+        try:
+            async with self._semaphore:
+                token = await self.refresh(account["type"], email, account["password"])
+
+            if token:
+                self.refreshed += 1
+                self._retry_at.pop(key, None)
+                print(f"Refreshed {account['type']} token for {email}")
+                return
+        except Exception as e:
+            print(f"Error refreshing token for {email}: {e}")
+        finally:
+            self._running.discard(key)
+
+        self.failed += 1
+        self._retry_at[key] = datetime.now(timezone.utc) + self.retry_delay
+
+    def stats(self) -> dict:
+        with self._lock:
+            tracked = len(self._accounts)
+
+        return {
+            "tracked": tracked,
+            "running": len(self._running),
+            "refreshed": self.refreshed,
+            "failed": self.failed,
+        }
@@ -0,0 +1,135 @@
+from datetime import datetime, timezone
+from cryptography.fernet import Fernet, InvalidToken
+from typing import Callable, Optional
+import hashlib
+import hmac
+import json
+import os
+
+def password_digest(secret: bytes, password: str) -> str:
+    """
+    Keyed hash of an account password, kept with saved sessions and credentials
+    so they are only used for callers that know the password.
+    """
+    return hmac.new(secret, password.encode(), hashlib.sha256).hexdigest()
+
+def password_matches(secret: bytes, digest: Optional[str], password: str) -> bool:
+    return bool(digest) and hmac.compare_digest(digest, password_digest(secret, password))
+
+class SessionStore:
+    """
+    Encrypted store of Playwright storage_state (cookies and localStorage) per account.
+
+    States are encrypted with Fernet before they leave the process and are kept
+    either as files in a local directory or as documents in a Firestore collection.
+    Each is saved with an HMAC of the account password (keyed with the Fernet key)
+    and only loaded for a caller with the same password.
+    """
+
+    def __init__(self, key: str, backend: str = "local", directory: str = "sessions", get_db: Optional[Callable] = None, collection: str = "sessions"):
+        """
+        Args:
+            key (str): Fernet key (urlsafe base64, 32 bytes)
+            backend (str): "local" or "firestore"
+            directory (str): Directory for the local backend
+            get_db: Returns the Firestore client for the firestore backend
+            collection (str): Collection for the firestore backend
+        """
+        self.fernet = Fernet(key)
+        self.secret = key.encode()
+        self.backend = backend
+        self.directory = directory
+        self.get_db = get_db
+        self.collection = collection
+
+        self.hits = 0
+        self.misses = 0
+
+        if backend == "local":
+            os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def _id(type: str, email: str) -> str:
+        # Hashed so neither file names nor document IDs reveal the account
+        return hashlib.sha256(f"{type.lower()}:{email}".encode()).hexdigest()
+
+    def _path(self, type: str, email: str) -> str:
+        return os.path.join(self.directory, self._id(type, email) + ".bin")
+
+    def load(self, type: str, email: str, password: str) -> Optional[dict]:
+        """
+        Returns:
+            dict: The saved storage_state, or None if there is none, it cannot be decrypted
+                  or it was saved with another password
+        """
+        try:
+            if self.backend == "firestore":
+                doc = self.get_db().collection(self.collection).document(self._id(type, email)).get()
+                blob = doc.to_dict().get("state") if doc.exists else None
+            else:
+                path = self._path(type, email)
+                blob = None
+                if os.path.exists(path):
+                    with open(path, "rb") as file:
+                        blob = file.read()
+
+            if not blob:
+                self.misses += 1
+                return None
+
+            saved = json.loads(self.fernet.decrypt(blob))
+
+            # Sessions saved before passwords were checked never match and are replaced at the next login
+            if not isinstance(saved, dict) or not password_matches(self.secret, saved.get("password"), password):
+                print(f"Saved session for {email} does not match the password, not using it")
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            return saved.get("state")
+        except (InvalidToken, ValueError) as e:
+            print(f"Discarding unreadable session for {email}: {e}")
+            self.delete(type, email)
+            self.misses += 1
+            return None
+        except Exception as e:
+            print(f"Error loading session for {email}: {e}")
+            self.misses += 1
+            return None
+
+    def save(self, type: str, email: str, state: dict, password: str):
+        try:
+            saved = {"state": state, "password": password_digest(self.secret, password)}
+            blob = self.fernet.encrypt(json.dumps(saved).encode())
+
+            if self.backend == "firestore":
+                self.get_db().collection(self.collection).document(self._id(type, email)).set({
+                    "state": blob,
+                    "age": datetime.now(timezone.utc)
+                })
+            else:
+                path = self._path(type, email)
+                temp_path = path + ".tmp"
+                with open(temp_path, "wb") as file:
+                    file.write(blob)
+                os.replace(temp_path, path)
+        except Exception as e:
+            print(f"Error saving session for {email}: {e}")
+
+    def delete(self, type: str, email: str):
+        try:
+            if self.backend == "firestore":
+                self.get_db().collection(self.collection).document(self._id(type, email)).delete()
+            else:
+                path = self._path(type, email)
+                if os.path.exists(path):
+                    os.remove(path)
+        except Exception as e:
+            print(f"Error deleting session for {email}: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,59 @@
+from typing import Awaitable, Callable, Hashable
+import asyncio
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key into a single execution.
+
+    The first caller for a key starts the work; callers that arrive while it is
+    still running await the same task and get the same result or exception.
+    Must only be used from one event loop.
+    """
+
+    def __init__(self):
+        self._tasks = {}
+        self.started = 0
+        self.shared = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable]):
+        """
+        Args:
+            key: Identifies calls that may share a result
+            fn: Zero-argument coroutine function that does the work
+
+        Returns:
+            Whatever fn returns, shared between all callers for the key
+        """
+        task = self._tasks.get(key)
+
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._tasks[key] = task
+            self.started += 1
+
+            def forget(done, key=key):
+                if self._tasks.get(key) is done:
+                    del self._tasks[key]
+
+            task.add_done_callback(forget)
+        else:
+            self.shared += 1
+
+        # A waiter giving up must not cancel the work other callers are awaiting
+        return await asyncio.shield(task)
+
+    def in_flight(self) -> int:
+        return len(self._tasks)
+
+    def keys(self) -> list:
+        """
+        Keys with work running. A snapshot, so it may also be read from other threads.
+        """
+        return list(self._tasks)
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight(),
+            "started": self.started,
+            "shared": self.shared,
+        }
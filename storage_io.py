@@ -0,0 +1,65 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Optional
+import threading
+import asyncio
+
+_executor: Optional[ThreadPoolExecutor] = None
+_lock = threading.Lock()
+_max_workers = 16
+
+_in_flight = 0
+_calls = 0
+
+def configure(max_workers: int):
+    """
+    Set the pool size. Takes effect if called before the first run_io().
+    """
+    global _max_workers
+    _max_workers = max(1, max_workers)
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=_max_workers, thread_name_prefix="storage-io")
+    return _executor
+
+async def run_io(fn, *args, **kwargs):
+    """
+    Run a blocking storage call (Firestore, SQLite, session files) on the dedicated
+    storage thread pool and await its result.
+
+    The synchronous Firestore client holds its thread for a whole round trip. Calls
+    made from the auth loop go through here so concurrent logins keep driving their
+    browsers while others wait on storage, and so storage calls never queue behind
+    unrelated work in asyncio's default executor.
+    """
+    global _in_flight, _calls
+
+    with _lock:
+        _in_flight += 1
+        _calls += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_get_executor(), partial(fn, *args, **kwargs))
+    finally:
+        with _lock:
+            _in_flight -= 1
+
+def shutdown():
+    global _executor
+
+    with _lock:
+        executor, _executor = _executor, None
+
+    if executor is not None:
+        executor.shutdown(wait=False)
+
+def stats() -> dict:
+    return {
+        "threads": _max_workers,
+        "in_flight": _in_flight,
+        "calls": _calls,
+    }
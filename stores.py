@@ -0,0 +1,597 @@
+from datetime import datetime, timezone, timedelta
+from typing import Callable, Dict, Iterable, Optional
+from abc import ABC, abstractmethod
+from otp_listener import OtpDispatcher
+from storage_io import run_io
+import threading
+import asyncio
+import sqlite3
+import time
+
+class TokenStore(ABC):
+    """
+    Where tokens, OTP codes and auth leases are kept.
+
+    Tokens are stored per (merchant type, email) as {"token": str, "age": datetime,
+    "expires": datetime}, where expires is when the token stops being served as fresh.
+    OTP codes are stored per email and consumed by the login waiting for them.
+    Methods other than wait_otp() block and are called from request threads or,
+    on the auth loop, through storage_io.run_io().
+    """
+
+    backend = "base"
+    otp_poll_interval = 0.25
+
+    @abstractmethod
+    def get_token(self, type: str, email: str) -> Optional[dict]:
+        """
+        Returns:
+            dict: {"token", "age", "expires"} as stored ("expires" may be missing on
+                  records written before it was stored), or None if there is no record
+        """
+        raise NotImplementedError
+
+    def get_tokens(self, accounts: Iterable[tuple]) -> Dict[tuple, dict]:
+        """
+        Read many token records at once.
+
+        Args:
+            accounts: Iterable of (type, email) pairs
+
+        Returns:
+            dict: (type lowercased, email) -> record for every account that has one
+        """
+        records = {}
+        for type, email in accounts:
+            record = self.get_token(type, email)
+            if record:
+                records[(type.lower(), email)] = record
+        return records
+
+    @abstractmethod
+    def save_token(self, type: str, email: str, token: str, age: datetime, expires: datetime):
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_token(self, type: str, email: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    def put_otp(self, email: str, otp: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    def take_otp(self, email: str) -> Optional[str]:
+        """
+        Read and delete the OTP code stored for an email.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_otp(self, email: str):
+        raise NotImplementedError
+
+    async def wait_otp(self, email: str, timeout: float = 120) -> Optional[str]:
+        """
+        Wait for an OTP code for an email and consume it.
+
+        Returns:
+            str: The OTP code, None if none arrived within timeout seconds
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+
+        while True:
+            try:
+                otp = await run_io(self.take_otp, email)
+                if otp:
+                    print("\nGot otp code: " + otp)
+                    return otp
+            except Exception as e:
+                print(f"Error polling for OTP: {e}")
+
+            if loop.time() >= deadline:
+                return None
+
+            await asyncio.sleep(self.otp_poll_interval)
+
+    @abstractmethod
+    def acquire_lease(self, key: str, owner: str, ttl: timedelta) -> bool:
+        """
+        Take a lease unless another owner holds an unexpired one.
+
+        Returns:
+            bool: True if `owner` now holds the lease
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def release_lease(self, key: str, owner: str):
+        """
+        Drop a lease if `owner` holds it.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def sweep(self, targets: Dict[str, tuple], batch_size: int = 200, max_deletes_per_sec: float = 100) -> Dict[str, int]:
+        """
+        Delete expired records.
+
+        Args:
+            targets (dict): "tokens<type>" or "otp" -> (timestamp field, how far in the past it may be);
+                            the field is "age" or, for tokens, "expires". Token targets may add a third
+                            element: how far in the past "age" may be for records without "expires"
+
+        Returns:
+            dict: Target -> number of records deleted (-1 if the sweep failed)
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def stats(self) -> dict:
+        return {"backend": self.backend}
+
+class FirestoreStore(TokenStore):
+    """
+    Tokens in the "tokens<type>" collections, OTP codes in "otp" and leases in
+    "authleases", keyed by email. OTP codes are pushed by one shared on_snapshot
+    listener; the store falls back to polling if the listener cannot start.
+    """
+
+    backend = "firestore"
+    otp_poll_interval = 1
+    # Seconds between checks that the OTP listener is still streaming while a login waits on it
+    otp_watch_check = 5
+
+    def __init__(self, get_db: Callable):
+        """
+        Args:
+            get_db: Returns the shared Firestore client
+        """
+        self.get_db = get_db
+        self.otp = OtpDispatcher()
+
+    def _token_ref(self, type: str, email: str):
+        return self.get_db().collection(f'tokens{type.lower()}').document(email)
+
+    def get_token(self, type: str, email: str) -> Optional[dict]:
+        token_doc = self._token_ref(type, email).get()
+        return token_doc.to_dict() if token_doc.exists else None
+
+    def get_tokens(self, accounts: Iterable[tuple]) -> Dict[tuple, dict]:
+        refs = {(type.lower(), email): self._token_ref(type, email) for type, email in accounts}
+        if not refs:
+            return {}
+
+        keys_by_path = {ref.path: key for key, ref in refs.items()}
+        records = {}
+
+        # One round trip for every account
+        for token_doc in self.get_db().get_all(list(refs.values())):
+            if token_doc.exists:
+                records[keys_by_path[token_doc.reference.path]] = token_doc.to_dict()
+
+        return records
+
+    def save_token(self, type: str, email: str, token: str, age: datetime, expires: datetime):
+        self._token_ref(type, email).set({
+            "token": token,
+            "age": age,
+            "expires": expires
+        })
+
+    def delete_token(self, type: str, email: str):
+        self._token_ref(type, email).delete()
+
+    def put_otp(self, email: str, otp: str):
+        self.get_db().collection("otp").document(email).set({
+            "otp": otp,
+            "age": datetime.now(timezone.utc)
+        })
+
+    def take_otp(self, email: str) -> Optional[str]:
+        doc_ref = self.get_db().collection("otp").document(email)
+        doc = doc_ref.get()
+        if not doc.exists:
+            return None
+
+        doc_ref.delete()
+        return doc.to_dict().get("otp")
+
+    def delete_otp(self, email: str):
+        self.get_db().collection("otp").document(email).delete()
+
+    async def wait_otp(self, email: str, timeout: float = 120) -> Optional[str]:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return None
+
+            # Starting the listener may create the client and open its stream. Checked on every
+            # pass so a stream that closes mid-wait is restarted or replaced by polling.
+            if not self.otp.running and not await run_io(lambda: self.otp.ensure_started(self.get_db(), loop)):
+                return await super().wait_otp(email, remaining)
+
+            # Codes arriving between passes are kept by the dispatcher for the next one
+            result = await self.otp.wait(email, min(remaining, self.otp_watch_check))
+            if not result:
+                continue
+
+            doc_ref, otp = result
+            try:
+                await run_io(doc_ref.delete)
+            except Exception as e:
+                print(f"Error deleting OTP document: {e}")
+
+            if otp:
+                print("\nGot otp code: " + otp)
+                return otp
+
+    def acquire_lease(self, key: str, owner: str, ttl: timedelta) -> bool:
+        from google.cloud import firestore
+
+        db = self.get_db()
+
+        @firestore.transactional
+        def take(transaction, lease_ref):
+            lease = lease_ref.get(transaction=transaction)
+            current_time = datetime.now(timezone.utc)
+
+            if lease.exists:
+                data = lease.to_dict()
+                expires = data.get("expires")
+                if expires and expires > current_time and data.get("owner") != owner:
+                    return False
+
+            transaction.set(lease_ref, {
+                "owner": owner,
+                "expires": current_time + ttl
+            })
+            return True
+
+        return take(db.transaction(), db.collection("authleases").document(key))
+
+    def release_lease(self, key: str, owner: str):
+        lease_ref = self.get_db().collection("authleases").document(key)
+        lease = lease_ref.get()
+        if lease.exists and lease.to_dict().get("owner") == owner:
+            lease_ref.delete()
+
+    def sweep(self, targets: Dict[str, tuple], batch_size: int = 200, max_deletes_per_sec: float = 100) -> Dict[str, int]:
+        from sweeper import sweep
+
+        return sweep(self.get_db(), targets, batch_size, max_deletes_per_sec)
+
+    def close(self):
+        self.otp.stop()
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend,
+            "otp_listener": self.otp.stats(),
+        }
+
+class MemoryStore(TokenStore):
+    """
+    Everything in dictionaries of this process. For single-node deployments,
+    tests and benchmarks; nothing survives a restart or is seen by other workers.
+    """
+
+    backend = "memory"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tokens = {}
+        self._otps = {}
+        self._leases = {}
+
+    def get_token(self, type: str, email: str) -> Optional[dict]:
+        with self._lock:
+            record = self._tokens.get((type.lower(), email))
+            return dict(record) if record else None
+
+    def save_token(self, type: str, email: str, token: str, age: datetime, expires: datetime):
+        with self._lock:
+            self._tokens[(type.lower(), email)] = {"token": token, "age": age, "expires": expires}
+
+    def delete_token(self, type: str, email: str):
+        with self._lock:
+            self._tokens.pop((type.lower(), email), None)
+
+    def put_otp(self, email: str, otp: str):
+        with self._lock:
+            self._otps[email] = (otp, datetime.now(timezone.utc))
+
+    def take_otp(self, email: str) -> Optional[str]:
+        with self._lock:
+            entry = self._otps.pop(email, None)
+            return entry[0] if entry else None
+
+    def delete_otp(self, email: str):
+        with self._lock:
+            self._otps.pop(email, None)
+
+    def acquire_lease(self, key: str, owner: str, ttl: timedelta) -> bool:
+        current_time = datetime.now(timezone.utc)
+
+        with self._lock:
+            lease = self._leases.get(key)
+            if lease and lease[1] > current_time and lease[0] != owner:
+                return False
+
+            self._leases[key] = (owner, current_time + ttl)
+            return True
+
+    def release_lease(self, key: str, owner: str):
+        with self._lock:
+            lease = self._leases.get(key)
+            if lease and lease[0] == owner:
+                del self._leases[key]
+
+    def sweep(self, targets: Dict[str, tuple], batch_size: int = 200, max_deletes_per_sec: float = 100) -> Dict[str, int]:
+        current_time = datetime.now(timezone.utc)
+        counts = {}
+
+        with self._lock:
+            for name, (field, max_age, *legacy) in targets.items():
+                cutoff = current_time - max_age
+
+                if name == "otp":
+                    expired = [email for email, (_, age) in self._otps.items() if age < cutoff]
+                    for email in expired:
+                        del self._otps[email]
+                else:
+                    type = name[len("tokens"):]
+                    legacy_cutoff = current_time - legacy[0] if legacy else None
+
+                    def is_expired(record):
+                        if record.get(field) is not None:
+                            return record[field] < cutoff
+                        return legacy_cutoff is not None and record["age"] < legacy_cutoff
+
+                    expired = [key for key, record in self._tokens.items() if key[0] == type and is_expired(record)]
+                    for key in expired:
+                        del self._tokens[key]
+
+                counts[name] = len(expired)
+
+            expired = [key for key, (_, expires) in self._leases.items() if expires <= current_time]
+            for key in expired:
+                del self._leases[key]
+
+        print(f"Sweep finished: {counts}")
+        return counts
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "backend": self.backend,
+                "tokens": len(self._tokens),
+                "otps": len(self._otps),
+                "leases": len(self._leases),
+            }
+
+class SQLiteStore(TokenStore):
+    """
+    Everything in one SQLite database file in WAL mode.
+
+    Any number of processes on the host can share the file. Placed on a tmpfs
+    such as /dev/shm it is a shared in-memory store for several workers; on
+    disk it also survives restarts. Each thread uses its own connection.
+    """
+
+    backend = "sqlite"
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS tokens (type TEXT NOT NULL, email TEXT NOT NULL, token TEXT NOT NULL, age REAL NOT NULL, expires REAL, PRIMARY KEY (type, email));
+    CREATE INDEX IF NOT EXISTS tokens_age ON tokens (type, age);
+    CREATE TABLE IF NOT EXISTS otp (email TEXT PRIMARY KEY, otp TEXT NOT NULL, age REAL NOT NULL);
+    CREATE TABLE IF NOT EXISTS leases (key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL);
+    """
+
+    def __init__(self, path: str = "tokens.db", busy_timeout: float = 5):
+        """
+        Args:
+            path (str): Database file
+            busy_timeout (float): Seconds to wait for another writer's lock
+        """
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._generation = 0
+
+        connection = self._connection()
+        connection.executescript(self.SCHEMA)
+
+        # Databases created before tokens carried their expiry
+        columns = [row[1] for row in connection.execute("PRAGMA table_info(tokens)")]
+        if "expires" not in columns:
+            connection.execute("ALTER TABLE tokens ADD COLUMN expires REAL")
+        connection.execute("CREATE INDEX IF NOT EXISTS tokens_expires ON tokens (type, expires)")
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        # A connection from before close() has been closed by another thread
+        if connection is None or self._local.generation != self._generation:
+            # Autocommit; multi-statement writes use explicit BEGIN IMMEDIATE. Each connection
+            # is only used by its own thread, but close() closes them all from one thread
+            connection = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+
+            with self._connections_lock:
+                self._connections.append(connection)
+                self._local.generation = self._generation
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def _datetime(timestamp: float) -> datetime:
+        return datetime.fromtimestamp(timestamp, tz=timezone.utc)
+
+    def _record(self, token: str, age: float, expires: Optional[float]) -> dict:
+        record = {"token": token, "age": self._datetime(age)}
+        if expires is not None:
+            record["expires"] = self._datetime(expires)
+        return record
+
+    def get_token(self, type: str, email: str) -> Optional[dict]:
+        row = self._connection().execute(
+            "SELECT token, age, expires FROM tokens WHERE type = ? AND email = ?", (type.lower(), email)
+        ).fetchone()
+        return self._record(*row) if row else None
+
+    def get_tokens(self, accounts: Iterable[tuple]) -> Dict[tuple, dict]:
+        records = {}
+        keys = list({(type.lower(), email) for type, email in accounts})
+        connection = self._connection()
+
+        # Stay well under SQLite's bound parameter limit
+        for start in range(0, len(keys), 400):
+            chunk = keys[start:start + 400]
+            clauses = " OR ".join("(type = ? AND email = ?)" for _ in chunk)
+            params = [value for key in chunk for value in key]
+
+            for type, email, token, age, expires in connection.execute(f"SELECT type, email, token, age, expires FROM tokens WHERE {clauses}", params):
+                records[(type, email)] = self._record(token, age, expires)
+
+        return records
+
+    def save_token(self, type: str, email: str, token: str, age: datetime, expires: datetime):
+        self._connection().execute(
+            "INSERT OR REPLACE INTO tokens (type, email, token, age, expires) VALUES (?, ?, ?, ?, ?)",
+            (type.lower(), email, token, age.timestamp(), expires.timestamp())
+        )
+
+    def delete_token(self, type: str, email: str):
+        self._connection().execute("DELETE FROM tokens WHERE type = ? AND email = ?", (type.lower(), email))
+
+    def put_otp(self, email: str, otp: str):
+        self._connection().execute(
+            "INSERT OR REPLACE INTO otp (email, otp, age) VALUES (?, ?, ?)",
+            (email, otp, time.time())
+        )
+
+    def take_otp(self, email: str) -> Optional[str]:
+        connection = self._connection()
+
+        # Polled often, so only take the write lock when there is a code
+        row = connection.execute("SELECT otp FROM otp WHERE email = ?", (email,)).fetchone()
+        if not row:
+            return None
+
+        # Only one waiter across all workers gets to delete (and use) the code
+        cursor = connection.execute("DELETE FROM otp WHERE email = ? AND otp = ?", (email, row[0]))
+        return row[0] if cursor.rowcount else None
+
+    def delete_otp(self, email: str):
+        self._connection().execute("DELETE FROM otp WHERE email = ?", (email,))
+
+    def acquire_lease(self, key: str, owner: str, ttl: timedelta) -> bool:
+        connection = self._connection()
+        current_time = time.time()
+
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute("SELECT owner, expires FROM leases WHERE key = ?", (key,)).fetchone()
+            if row and row[1] > current_time and row[0] != owner:
+                connection.execute("ROLLBACK")
+                return False
+
+            connection.execute(
+                "INSERT OR REPLACE INTO leases (key, owner, expires) VALUES (?, ?, ?)",
+                (key, owner, current_time + ttl.total_seconds())
+            )
+            connection.execute("COMMIT")
+            return True
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def release_lease(self, key: str, owner: str):
+        self._connection().execute("DELETE FROM leases WHERE key = ? AND owner = ?", (key, owner))
+
+    def sweep(self, targets: Dict[str, tuple], batch_size: int = 200, max_deletes_per_sec: float = 100) -> Dict[str, int]:
+        connection = self._connection()
+        current_time = time.time()
+        counts = {}
+
+        for name, (field, max_age, *legacy) in targets.items():
+            cutoff = current_time - max_age.total_seconds()
+
+            try:
+                if name == "otp":
+                    cursor = connection.execute("DELETE FROM otp WHERE age < ?", (cutoff,))
+                elif field == "expires" and legacy:
+                    # Rows from before the expires column was added go by their age
+                    cursor = connection.execute(
+                        "DELETE FROM tokens WHERE type = ? AND (expires < ? OR (expires IS NULL AND age < ?))",
+                        (name[len("tokens"):], cutoff, current_time - legacy[0].total_seconds())
+                    )
+                elif field == "expires":
+                    cursor = connection.execute("DELETE FROM tokens WHERE type = ? AND expires < ?", (name[len("tokens"):], cutoff))
+                else:
+                    cursor = connection.execute("DELETE FROM tokens WHERE type = ? AND age < ?", (name[len("tokens"):], cutoff))
+                counts[name] = cursor.rowcount
+            except sqlite3.Error as e:
+                print(f"Error sweeping {name}: {e}")
+                counts[name] = -1
+
+        connection.execute("DELETE FROM leases WHERE expires <= ?", (current_time,))
+
+        print(f"Sweep finished: {counts}")
+        return counts
+
+    def close(self):
+        """
+        Close the connections of every thread that used the store, including the storage-io threads.
+        """
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+            self._generation += 1
+
+        for connection in connections:
+            connection.close()
+        self._local.connection = None
+
+    def stats(self) -> dict:
+        try:
+            tokens = self._connection().execute("SELECT COUNT(*) FROM tokens").fetchone()[0]
+        except sqlite3.Error:
+            tokens = None
+
+        return {
+            "backend": self.backend,
+            "path": self.path,
+            "tokens": tokens,
+        }
+
+def create_store(backend: str, get_db: Optional[Callable] = None, path: Optional[str] = None) -> TokenStore:
+    """
+    Build the store named by configuration.
+
+    Args:
+        backend (str): "firestore", "memory", "sqlite" or "shm" (SQLite on /dev/shm,
+                       shared by every worker on the host)
+        get_db: Returns the Firestore client, for the firestore backend
+        path (str): Database file for the sqlite and shm backends
+    """
+    backend = backend.lower()
+
+    if backend == "firestore":
+        return FirestoreStore(get_db)
+    if backend == "memory":
+        return MemoryStore()
+    if backend == "sqlite":
+        return SQLiteStore(path or "tokens.db")
+    if backend == "shm":
+        return SQLiteStore(path or "/dev/shm/authtask-tokens.db")
+
+    raise ValueError(f"Unknown token store: {backend}")
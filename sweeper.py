@@ -0,0 +1,180 @@
+from google.cloud.firestore_v1.base_query import FieldFilter
+from datetime import datetime, timezone, timedelta
+from typing import Dict, Optional
+import threading
+import time
+
+def sweep_collection(db, name: str, max_age: timedelta, batch_size: int = 200, max_deletes_per_sec: float = 100, field: str = "age") -> int:
+    """
+    Delete every document in a collection whose timestamp `field` is more than max_age in the past.
+
+    Args:
+        db: Firebase database instance
+        name (str): Collection name
+        max_age (timedelta): Documents whose field is older than this are deleted
+        batch_size (int): Documents per batched write (Firestore allows up to 500)
+        max_deletes_per_sec (float): Rate limit across batches
+        field (str): Timestamp field compared, e.g. "age" or "expires"
+
+    Returns:
+        int: Number of documents deleted
+    """
+    cutoff = datetime.now(timezone.utc) - max_age
+    batch_size = max(1, min(batch_size, 500))
+    deleted = 0
+
+    while True:
+        docs = list(
+            db.collection(name)
+            .where(filter=FieldFilter(field, "<", cutoff))
+            .limit(batch_size)
+            .stream()
+        )
+        if not docs:
+            return deleted
+
+        started = time.monotonic()
+
+        batch = db.batch()
+        for doc in docs:
+            batch.delete(doc.reference)
+        batch.commit()
+
+        deleted += len(docs)
+
+        if len(docs) < batch_size:
+            return deleted
+
+        # Spread batches out so a large backlog does not spike write load
+        if max_deletes_per_sec > 0:
+            min_duration = len(docs) / max_deletes_per_sec
+            elapsed = time.monotonic() - started
+            if elapsed < min_duration:
+                time.sleep(min_duration - elapsed)
+
+def sweep_missing(db, name: str, missing: str, max_age: timedelta, batch_size: int = 200, max_deletes_per_sec: float = 100) -> int:
+    """
+    Delete documents without the field `missing` whose "age" is more than max_age in the past,
+    e.g. token documents written before they carried an expiry.
+
+    Firestore cannot query for a missing field, so every document past the cutoff is read,
+    including live ones whose field is still in the future. That makes it a one-off
+    cleanup (python sweeper.py --legacy), too costly for the regular sweep.
+
+    Returns:
+        int: Number of documents deleted
+    """
+    cutoff = datetime.now(timezone.utc) - max_age
+    batch_size = max(1, min(batch_size, 500))
+    deleted = 0
+
+    docs = db.collection(name).where(filter=FieldFilter("age", "<", cutoff)).stream()
+    stale = [doc for doc in docs if (doc.to_dict() or {}).get(missing) is None]
+
+    for start in range(0, len(stale), batch_size):
+        chunk = stale[start:start + batch_size]
+        started = time.monotonic()
+
+        batch = db.batch()
+        for doc in chunk:
+            batch.delete(doc.reference)
+        batch.commit()
+
+        deleted += len(chunk)
+
+        if max_deletes_per_sec > 0:
+            min_duration = len(chunk) / max_deletes_per_sec
+            elapsed = time.monotonic() - started
+            if elapsed < min_duration:
+                time.sleep(min_duration - elapsed)
+
+    return deleted
+
+def sweep(db, targets: Dict[str, tuple], batch_size: int = 200, max_deletes_per_sec: float = 100) -> Dict[str, int]:
+    """
+    Sweep expired documents from several collections.
+
+    Args:
+        db: Firebase database instance
+        targets (dict): Collection name -> (timestamp field, how far in the past it may be), optionally
+                        with a third element: how far in the past "age" may be for documents without the field
+
+    Returns:
+        dict: Collection name -> number of documents deleted (-1 if the sweep failed)
+    """
+    counts = {}
+
+    for name, (field, max_age, *legacy) in targets.items():
+        try:
+            counts[name] = sweep_collection(db, name, max_age, batch_size, max_deletes_per_sec, field)
+            if legacy and field != "age":
+                counts[name] += sweep_missing(db, name, field, legacy[0], batch_size, max_deletes_per_sec)
+        except Exception as e:
+            print(f"Error sweeping {name}: {e}")
+            counts[name] = -1
+
+    print(f"Sweep finished: {counts}")
+    return counts
+
+class Sweeper:
+    """
+    Background thread that sweeps a token store on a fixed interval.
+    """
+
+    def __init__(self, store, targets: Dict[str, tuple], interval: float = 300, batch_size: int = 200, max_deletes_per_sec: float = 100):
+        self.store = store
+        self.targets = targets
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_deletes_per_sec = max_deletes_per_sec
+
+        self.runs = 0
+        self.last_run: Optional[datetime] = None
+        self.last_counts: Dict[str, int] = {}
+        self.total_deleted = 0
+
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+
+        self._thread = threading.Thread(target=self._run, name="sweeper", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def run_once(self) -> Dict[str, int]:
+        counts = self.store.sweep(self.targets, self.batch_size, self.max_deletes_per_sec)
+
+        self.runs += 1
+        self.last_run = datetime.now(timezone.utc)
+        self.last_counts = counts
+        self.total_deleted += sum(c for c in counts.values() if c > 0)
+        return counts
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Error running sweeper: {e}")
+            self._stop.wait(self.interval)
+
+    def stats(self) -> dict:
+        return {
+            "runs": self.runs,
+            "last_run": self.last_run.isoformat() if self.last_run else None,
+            "last_counts": self.last_counts,
+            "total_deleted": self.total_deleted,
+        }
+
+if __name__ == '__main__':
+    # One-off sweep, e.g. from Cloud Scheduler: python sweeper.py
+    # Once after upgrading, python sweeper.py --legacy also removes token records without an expiry
+    import sys
+    from main import token_store, sweep_targets, SWEEP_BATCH_SIZE, SWEEP_MAX_DELETES_PER_SEC
+
+    token_store.sweep(sweep_targets(legacy="--legacy" in sys.argv[1:]), SWEEP_BATCH_SIZE, SWEEP_MAX_DELETES_PER_SEC)
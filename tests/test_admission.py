@@ -0,0 +1,64 @@
+from admission import AdmissionControl
+import asyncio
+
+def fill(admission, count):
+    for _ in range(count):
+        assert admission.try_enter()
+
+def test_sheds_past_slots_and_queue():
+    admission = AdmissionControl(slots=2, max_queue=3)
+    fill(admission, 5)
+
+    assert not admission.try_enter()
+    assert admission.stats()["shed"] == 1
+
+    admission.leave()
+    assert admission.try_enter()
+
+def test_retry_after_uses_initial_estimate_before_any_login():
+    admission = AdmissionControl(slots=2, max_queue=4, initial_estimate=30)
+    fill(admission, 6)
+
+    # 5 logins ahead of a new one at 2 at a time: 3 rounds of 30 seconds
+    assert admission.retry_after() == 90
+
+def test_retry_after_follows_measured_login_time():
+    admission = AdmissionControl(slots=2, max_queue=4, initial_estimate=30, smoothing=0.5)
+    admission.observe(10)
+    admission.observe(20)
+    fill(admission, 6)
+
+    # The first measurement replaces the estimate, later ones are averaged in: 15 seconds
+    assert admission.retry_after() == 45
+
+def test_retry_after_is_at_least_one_second():
+    admission = AdmissionControl(slots=4, max_queue=4)
+    admission.observe(0.2)
+
+    assert admission.retry_after() == 1
+
+    fill(admission, 4)
+    assert admission.retry_after() == 1
+
+def test_retry_after_rounds_up():
+    admission = AdmissionControl(slots=1, max_queue=0)
+    admission.observe(2.4)
+    fill(admission, 1)
+
+    assert admission.retry_after() == 3
+
+def test_enter_waits_for_a_slot():
+    admission = AdmissionControl(slots=1, max_queue=0)
+    fill(admission, 1)
+
+    async def scenario():
+        waiter = asyncio.ensure_future(admission.enter(poll=0.01))
+        await asyncio.sleep(0.05)
+        waiting = not waiter.done()
+
+        admission.leave()
+        await asyncio.wait_for(waiter, timeout=1)
+        return waiting
+
+    assert asyncio.run(scenario())
+    assert admission.stats()["shed"] == 0
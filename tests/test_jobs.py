@@ -0,0 +1,42 @@
+from jobs import JobStore, current_flight, current_job
+
+def messages(job):
+    return [event["message"] for event in job.events]
+
+def test_report_goes_to_current_job():
+    jobs = JobStore()
+    job = jobs.create("privacy", "a@example.com")
+
+    jobs.report("outside the job API")
+    current_job.set(job)
+    try:
+        jobs.report("login started", "running")
+    finally:
+        current_job.set(None)
+
+    assert messages(job) == ["login started"]
+    assert job.status == "running"
+
+def test_report_reaches_every_job_following_a_login():
+    jobs = JobStore()
+    leader = jobs.create("privacy", "a@example.com")
+    joined = jobs.create("privacy", "a@example.com")
+    key = ("privacy", "a@example.com", "digest")
+
+    jobs.follow(key, leader)
+    jobs.follow(key, joined)
+
+    token = current_flight.set(key)
+    try:
+        jobs.report("login started", "running")
+        jobs.unfollow(key, joined)
+        jobs.report("waiting for OTP")
+    finally:
+        current_flight.reset(token)
+
+    assert messages(leader) == ["login started", "waiting for OTP"]
+    assert messages(joined) == ["login started"]
+    assert joined.status == "running"
+
+    jobs.unfollow(key, leader)
+    assert jobs.stats()["followed_logins"] == 0
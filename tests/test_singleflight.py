@@ -0,0 +1,87 @@
+from singleflight import SingleFlight
+import asyncio
+import pytest
+
+def test_concurrent_calls_share_one_execution():
+    flights = SingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "token"
+
+    async def scenario():
+        return await asyncio.gather(*(flights.do("key", work) for _ in range(5)))
+
+    assert asyncio.run(scenario()) == ["token"] * 5
+    assert len(calls) == 1
+    assert flights.stats() == {"in_flight": 0, "started": 1, "shared": 4}
+
+def test_different_keys_run_separately():
+    flights = SingleFlight()
+
+    async def work(value):
+        await asyncio.sleep(0.01)
+        return value
+
+    async def scenario():
+        return await asyncio.gather(
+            flights.do(("privacy", "a", "digest-1"), lambda: work("bad")),
+            flights.do(("privacy", "a", "digest-2"), lambda: work("good"))
+        )
+
+    assert asyncio.run(scenario()) == ["bad", "good"]
+    assert flights.started == 2
+
+def test_errors_are_shared_and_key_is_freed():
+    flights = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("login broke")
+
+    async def scenario():
+        results = await asyncio.gather(flights.do("key", fail), flights.do("key", fail), return_exceptions=True)
+        assert flights.keys() == []
+        return results
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+def test_keys_lists_running_work():
+    flights = SingleFlight()
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def work():
+            await release.wait()
+
+        task = asyncio.ensure_future(flights.do("key", work))
+        await asyncio.sleep(0)
+        running = flights.keys()
+        release.set()
+        await task
+        return running
+
+    assert asyncio.run(scenario()) == ["key"]
+
+def test_cancelled_waiter_does_not_cancel_work():
+    flights = SingleFlight()
+
+    async def scenario():
+        async def work():
+            await asyncio.sleep(0.02)
+            return "token"
+
+        impatient = asyncio.ensure_future(flights.do("key", work))
+        patient = asyncio.ensure_future(flights.do("key", work))
+        await asyncio.sleep(0)
+        impatient.cancel()
+
+        with pytest.raises(asyncio.CancelledError):
+            await impatient
+        return await patient
+
+    assert asyncio.run(scenario()) == "token"
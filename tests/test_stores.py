@@ -0,0 +1,160 @@
+from datetime import datetime, timezone, timedelta
+from stores import MemoryStore, SQLiteStore, TokenStore
+import threading
+import asyncio
+import pytest
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        store = MemoryStore()
+    else:
+        store = SQLiteStore(str(tmp_path / "tokens.db"))
+        store.otp_poll_interval = 0.01
+
+    yield store
+    store.close()
+
+def now():
+    return datetime.now(timezone.utc)
+
+def test_token_round_trip(store):
+    age = now()
+    expires = age + timedelta(minutes=5)
+    store.save_token("Privacy", "a@example.com", "token-a", age, expires)
+
+    record = store.get_token("privacy", "a@example.com")
+    assert record["token"] == "token-a"
+    assert abs(record["age"] - age) < timedelta(seconds=1)
+    assert abs(record["expires"] - expires) < timedelta(seconds=1)
+
+    assert store.get_token("extend", "a@example.com") is None
+    assert store.get_token("privacy", "b@example.com") is None
+
+def test_save_token_overwrites(store):
+    store.save_token("extend", "a@example.com", "old", now(), now() + timedelta(minutes=1))
+    store.save_token("extend", "a@example.com", "new", now(), now() + timedelta(minutes=1))
+
+    assert store.get_token("extend", "a@example.com")["token"] == "new"
+
+def test_get_tokens(store):
+    store.save_token("extend", "a@example.com", "token-a", now(), now() + timedelta(minutes=1))
+    store.save_token("privacy", "b@example.com", "token-b", now(), now() + timedelta(minutes=1))
+
+    records = store.get_tokens([("Extend", "a@example.com"), ("privacy", "b@example.com"), ("privacy", "c@example.com")])
+
+    assert set(records) == {("extend", "a@example.com"), ("privacy", "b@example.com")}
+    assert records[("extend", "a@example.com")]["token"] == "token-a"
+
+def test_delete_token(store):
+    store.save_token("privacy", "a@example.com", "token-a", now(), now() + timedelta(minutes=1))
+    store.delete_token("Privacy", "a@example.com")
+
+    assert store.get_token("privacy", "a@example.com") is None
+
+def test_otp_is_consumed_once(store):
+    store.put_otp("a@example.com", "123456")
+
+    assert store.take_otp("a@example.com") == "123456"
+    assert store.take_otp("a@example.com") is None
+
+def test_otp_consumed_by_one_of_many_takers(store):
+    store.put_otp("a@example.com", "123456")
+    taken = []
+
+    def take():
+        taken.append(store.take_otp("a@example.com"))
+
+    threads = [threading.Thread(target=take) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert [otp for otp in taken if otp] == ["123456"]
+
+def test_delete_otp(store):
+    store.put_otp("a@example.com", "123456")
+    store.delete_otp("a@example.com")
+
+    assert store.take_otp("a@example.com") is None
+
+def test_wait_otp(store):
+    async def scenario():
+        waiter = asyncio.ensure_future(store.wait_otp("a@example.com", timeout=5))
+        await asyncio.sleep(0.05)
+        store.put_otp("a@example.com", "654321")
+        return await waiter
+
+    assert asyncio.run(scenario()) == "654321"
+    assert store.take_otp("a@example.com") is None
+
+def test_wait_otp_times_out(store):
+    assert asyncio.run(store.wait_otp("a@example.com", timeout=0.05)) is None
+
+def test_lease_excludes_other_owners(store):
+    ttl = timedelta(minutes=1)
+
+    assert store.acquire_lease("privacy:a", "one", ttl)
+    assert store.acquire_lease("privacy:a", "one", ttl)
+    assert not store.acquire_lease("privacy:a", "two", ttl)
+    assert store.acquire_lease("privacy:b", "two", ttl)
+
+    # Only the holder can release it
+    store.release_lease("privacy:a", "two")
+    assert not store.acquire_lease("privacy:a", "two", ttl)
+
+    store.release_lease("privacy:a", "one")
+    assert store.acquire_lease("privacy:a", "two", ttl)
+
+def test_expired_lease_can_be_taken(store):
+    assert store.acquire_lease("privacy:a", "one", timedelta(seconds=-1))
+    assert store.acquire_lease("privacy:a", "two", timedelta(minutes=1))
+
+def test_sweep(store):
+    current_time = now()
+    store.save_token("privacy", "expired", "t", current_time - timedelta(hours=2), current_time - timedelta(hours=1))
+    store.save_token("privacy", "in_grace", "t", current_time - timedelta(hours=2), current_time - timedelta(minutes=5))
+    store.save_token("privacy", "fresh", "t", current_time, current_time + timedelta(hours=1))
+    store.save_token("extend", "expired", "t", current_time - timedelta(hours=2), current_time - timedelta(hours=1))
+    store.put_otp("fresh", "123456")
+
+    counts = store.sweep({
+        "tokensprivacy": ("expires", timedelta(minutes=15), timedelta(minutes=135)),
+        "otp": ("age", timedelta(minutes=10))
+    })
+
+    assert counts == {"tokensprivacy": 1, "otp": 0}
+    assert store.get_token("privacy", "expired") is None
+    assert store.get_token("privacy", "in_grace") is not None
+    assert store.get_token("privacy", "fresh") is not None
+    # Types not swept are left alone
+    assert store.get_token("extend", "expired") is not None
+    assert store.take_otp("fresh") == "123456"
+
+def test_sqlite_close_closes_every_thread_connection(tmp_path):
+    store = SQLiteStore(str(tmp_path / "tokens.db"))
+    store.save_token("privacy", "a@example.com", "token-a", now(), now() + timedelta(minutes=5))
+
+    connections = []
+
+    def read():
+        store.get_token("privacy", "a@example.com")
+        connections.append(store._local.connection)
+
+    thread = threading.Thread(target=read)
+    thread.start()
+    thread.join()
+
+    store.close()
+    assert store._connections == []
+    with pytest.raises(Exception):
+        connections[0].execute("SELECT 1")
+
+    # Threads that used the store before close() open a fresh connection
+    assert store.get_token("privacy", "a@example.com")["token"] == "token-a"
+    store.close()
+
+def test_token_store_is_abstract():
+    with pytest.raises(TypeError):
+        TokenStore()
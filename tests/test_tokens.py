@@ -0,0 +1,38 @@
+from datetime import datetime, timezone
+from tokens import decode_claims, token_expiry
+import base64
+import json
+
+def jwt(claims) -> str:
+    def encode(data) -> str:
+        return base64.urlsafe_b64encode(json.dumps(data).encode()).rstrip(b"=").decode()
+
+    return f"{encode({'alg': 'none'})}.{encode(claims)}.signature"
+
+def test_token_expiry_reads_exp_claim():
+    assert token_expiry(jwt({"exp": 1700000000})) == datetime(2023, 11, 14, 22, 13, 20, tzinfo=timezone.utc)
+
+def test_token_expiry_accepts_float_exp():
+    assert token_expiry(jwt({"exp": 1700000000.5})) == datetime(2023, 11, 14, 22, 13, 20, 500000, tzinfo=timezone.utc)
+
+def test_token_expiry_handles_unpadded_payloads():
+    # Payload lengths that need one and two "=" of padding
+    for sub in ("a", "ab", "abc"):
+        token = jwt({"sub": sub, "exp": 1700000000})
+        assert token_expiry(token) is not None
+
+def test_token_expiry_without_exp():
+    assert token_expiry(jwt({"sub": "a"})) is None
+    assert token_expiry(jwt({"exp": "tomorrow"})) is None
+
+def test_token_expiry_of_non_jwts():
+    assert token_expiry("opaque-token") is None
+    assert token_expiry("a.b.c") is None
+    assert token_expiry(jwt(["not", "a", "dict"])) is None
+    assert token_expiry("") is None
+
+def test_token_expiry_out_of_range():
+    assert token_expiry(jwt({"exp": 10 ** 20})) is None
+
+def test_decode_claims():
+    assert decode_claims(jwt({"iss": "issuer", "client_id": "client"})) == {"iss": "issuer", "client_id": "client"}
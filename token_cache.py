@@ -0,0 +1,110 @@
+from datetime import datetime, timezone
+from collections import OrderedDict
+from typing import Optional, Tuple
+import threading
+
+class TokenCache:
+    """
+    Bounded, thread-safe in-process LRU cache of auth tokens keyed by (type, email).
+
+    Entries keep the token's mint time and the time it stops being served as
+    fresh, as stored with the token in the token store.
+    """
+
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max(1, max_size)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def _key(type: str, email: str):
+        return (type.lower(), email)
+
+    def get(self, type: str, email: str) -> Optional[str]:
+        """
+        Args:
+            type (str): Merchant type ("Extend" or "Privacy")
+            email (str): Account email
+
+        Returns:
+            str: Cached token if present and fresh, None otherwise
+        """
+        key = self._key(type, email)
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            token, minted_at, expires_at = entry
+            if datetime.now(timezone.utc) >= expires_at:
+                # Kept until overwritten or evicted so it can still be served stale
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return token
+
+    def put(self, type: str, email: str, token: str, expires_at: datetime, minted_at: Optional[datetime] = None):
+        """
+        Store a token, evicting the least recently used entry when full.
+
+        Args:
+            expires_at (datetime): When the token stops being fresh
+            minted_at (datetime): When the token was minted (default: now)
+        """
+        if minted_at is None:
+            minted_at = datetime.now(timezone.utc)
+        elif minted_at.tzinfo is None:
+            minted_at = minted_at.replace(tzinfo=timezone.utc)
+
+        if expires_at.tzinfo is None:
+            expires_at = expires_at.replace(tzinfo=timezone.utc)
+
+        key = self._key(type, email)
+
+        with self._lock:
+            self._entries[key] = (token, minted_at, expires_at)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def peek(self, type: str, email: str) -> Optional[Tuple[str, datetime, datetime]]:
+        """
+        Cached (token, mint time, expiry) regardless of age, without counting a hit or changing LRU order.
+        """
+        with self._lock:
+            return self._entries.get(self._key(type, email))
+
+    def lifetime(self, type: str, email: str) -> Optional[Tuple[datetime, datetime]]:
+        """
+        (mint time, expiry) of the cached token, without counting a hit or changing LRU order.
+        """
+        entry = self.peek(type, email)
+        return entry[1:] if entry else None
+
+    def invalidate(self, type: str, email: str):
+        with self._lock:
+            self._entries.pop(self._key(type, email), None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
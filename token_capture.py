@@ -0,0 +1,100 @@
+from urllib.parse import urlparse
+from typing import Awaitable, Callable, Iterable, Optional
+import asyncio
+
+class TokenCapture:
+    """
+    Watches a page's network responses and resolves as soon as one carries the auth token.
+
+    Attach it right after the page is created so responses from the login and OTP
+    submits are seen. race() pairs it with the polling extractor as a fallback.
+    """
+
+    def __init__(self, page, parse: Callable[[object], Awaitable[Optional[str]]], ignore: Iterable[str] = ()):
+        """
+        Args:
+            page: Camoufox/Playwright page instance
+            parse: Coroutine function returning the token carried by a response, or None
+            ignore: Tokens that do not count as captured, e.g. ones restored from a saved session
+        """
+        self.page = page
+        self.parse = parse
+        self.ignore = frozenset(ignore)
+        self.future = asyncio.get_running_loop().create_future()
+
+        page.on("response", self._on_response)
+
+    async def _on_response(self, response):
+        if self.future.done():
+            return
+
+        try:
+            token = await self.parse(response)
+        except Exception:
+            return
+
+        if token and token not in self.ignore and not self.future.done():
+            self.future.set_result(token)
+
+    def close(self):
+        try:
+            self.page.remove_listener("response", self._on_response)
+        except Exception:
+            pass
+
+    async def race(self, fallback: Awaitable[Optional[str]]) -> Optional[str]:
+        """
+        Return the captured token, or the fallback's result if the fallback finishes first.
+
+        Args:
+            fallback: Polling extractor coroutine, cancelled once a token is captured
+        """
+        fallback_task = asyncio.ensure_future(fallback)
+        try:
+            await asyncio.wait({self.future, fallback_task}, return_when=asyncio.FIRST_COMPLETED)
+
+            if self.future.done():
+                token = self.future.result()
+                print(f"Captured token from response: {token[:20]}...")
+                return token
+
+            return fallback_task.result()
+        finally:
+            fallback_task.cancel()
+            self.close()
+
+async def privacy_token_from_response(response, host_suffix: str = "privacy.com") -> Optional[str]:
+    """
+    The "token" cookie set by an app.privacy.com response (or any host ending in host_suffix).
+    """
+    if not (urlparse(response.url).hostname or "").endswith(host_suffix):
+        return None
+
+    set_cookie = await response.header_value("set-cookie")
+    if not set_cookie:
+        return None
+
+    # Multiple Set-Cookie headers are joined with newlines
+    for cookie in set_cookie.split("\n"):
+        name, _, rest = cookie.strip().partition("=")
+        if name == "token":
+            value = rest.split(";")[0].strip()
+            if value:
+                return value
+
+    return None
+
+async def cognito_token_from_response(response, host_prefix: str = "cognito-idp.") -> Optional[str]:
+    """
+    The access token returned by a Cognito InitiateAuth / RespondToAuthChallenge call
+    (or a POST to any host starting with host_prefix).
+    """
+    if not (urlparse(response.url).hostname or "").startswith(host_prefix):
+        return None
+
+    if response.request.method != "POST" or not response.ok:
+        return None
+
+    data = await response.json()
+    result = data.get("AuthenticationResult") or {}
+    return result.get("AccessToken") or None
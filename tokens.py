@@ -0,0 +1,40 @@
+from datetime import datetime, timezone
+from typing import Optional
+import base64
+import json
+
+def decode_claims(token: str) -> Optional[dict]:
+    """
+    Decode a JWT's payload without verifying its signature.
+
+    Args:
+        token (str): JWT string
+
+    Returns:
+        dict: The token's claims, or None if it is not a JWT
+    """
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        claims = json.loads(base64.urlsafe_b64decode(payload))
+        return claims if isinstance(claims, dict) else None
+    except Exception:
+        return None
+
+def token_expiry(token: str) -> Optional[datetime]:
+    """
+    Returns:
+        datetime: The JWT's exp claim in UTC, or None if it has none
+    """
+    claims = decode_claims(token)
+    if not claims:
+        return None
+
+    exp = claims.get("exp")
+    if not isinstance(exp, (int, float)):
+        return None
+
+    try:
+        return datetime.fromtimestamp(exp, tz=timezone.utc)
+    except (OverflowError, OSError, ValueError):
+        return None